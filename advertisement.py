@@ -20,7 +20,12 @@ SOFTWARE.
 """
 
 import dbus
+import dbus.exceptions
 import dbus.service
+try:
+  from gi.repository import GObject
+except ImportError:
+    import gobject as GObject
 
 from bletools import BleTools
 
@@ -29,6 +34,18 @@ LE_ADVERTISING_MANAGER_IFACE = "org.bluez.LEAdvertisingManager1"
 DBUS_OM_IFACE = "org.freedesktop.DBus.ObjectManager"
 DBUS_PROP_IFACE = "org.freedesktop.DBus.Properties"
 LE_ADVERTISEMENT_IFACE = "org.bluez.LEAdvertisement1"
+ADAPTER_IFACE = "org.bluez.Adapter1"
+
+# re-register backoff, in ms
+RETRY_MIN = 500
+RETRY_MAX = 30000
+# legacy advertising data, including the 3 bytes of flags BlueZ adds
+MAX_AD_LENGTH = 31
+FLAGS_LENGTH = 3
+TX_POWER_LENGTH = 3
+
+class InvalidArgsException(dbus.exceptions.DBusException):
+    _dbus_error_name = "org.freedesktop.DBus.Error.InvalidArgs"
 
 
 class Advertisement(dbus.service.Object):
@@ -44,9 +61,18 @@ class Advertisement(dbus.service.Object):
         self.manufacturer_data = None
         self.service_data = None
         self.include_tx_power = None
+        self.properties = None
+        self.registered_callback = None
+        self.error_callback = None
+        self.released_callback = None
         dbus.service.Object.__init__(self, self.bus, self.path)
 
     def get_properties(self):
+        # GetAll is called on every (re-)registration, only rebuild the
+        # dbus wrappers after something changed
+        if self.properties is not None:
+            return self.properties
+
         properties = dict()
         properties["Type"] = self.ad_type
 
@@ -69,10 +95,34 @@ class Advertisement(dbus.service.Object):
         if self.include_tx_power is not None:
             properties["IncludeTxPower"] = dbus.Boolean(self.include_tx_power)
 
-        if self.local_name is not None:
-            properties["LocalName"] = dbus.String(self.local_name)
+        self.properties = {LE_ADVERTISEMENT_IFACE: properties}
+
+        return self.properties
+
+    def invalidate(self):
+        self.properties = None
 
-        return {LE_ADVERTISEMENT_IFACE: properties}
+    def data_length(self):
+        """
+        Bytes of advertising data the properties take. The local name is
+        left out, BlueZ moves it to the scan response when it does not fit.
+        """
+        def uuid_length(uuid):
+            return 2 if len(uuid) <= 4 else 4 if len(uuid) <= 8 else 16
+
+        length = FLAGS_LENGTH
+        sizes = {}
+        for uuid in self.service_uuids or []:
+            size = uuid_length(uuid)
+            sizes[size] = sizes.get(size, 0) + size
+        length += sum(2 + total for total in sizes.values())
+        for data in (self.manufacturer_data or {}).values():
+            length += 2 + 2 + len(data)
+        for uuid, data in (self.service_data or {}).items():
+            length += 2 + uuid_length(uuid) + len(data)
+        if self.include_tx_power:
+            length += TX_POWER_LENGTH
+        return length
 
     def get_path(self):
         return dbus.ObjectPath(self.path)
@@ -81,26 +131,46 @@ class Advertisement(dbus.service.Object):
         if not self.service_uuids:
             self.service_uuids = []
         self.service_uuids.append(uuid)
+        self.invalidate()
 
     def add_solicit_uuid(self, uuid):
         if not self.solicit_uuids:
             self.solicit_uuids = []
         self.solicit_uuids.append(uuid)
+        self.invalidate()
 
     def add_manufacturer_data(self, manuf_code, data):
         if not self.manufacturer_data:
             self.manufacturer_data = dbus.Dictionary({}, signature="qv")
         self.manufacturer_data[manuf_code] = dbus.Array(data, signature="y")
+        self.invalidate()
 
     def add_service_data(self, uuid, data):
         if not self.service_data:
             self.service_data = dbus.Dictionary({}, signature="sv")
         self.service_data[uuid] = dbus.Array(data, signature="y")
+        self.invalidate()
 
     def add_local_name(self, name):
-        if not self.local_name:
-            self.local_name = ""
         self.local_name = dbus.String(name)
+        self.invalidate()
+
+    def set_include_tx_power(self, include):
+        self.include_tx_power = include
+        self.invalidate()
+
+    def update_manufacturer_data(self, manuf_code, data):
+        if self.manufacturer_data is not None \
+                and manuf_code in self.manufacturer_data \
+                and bytes(self.manufacturer_data[manuf_code]) == bytes(data):
+            return False
+
+        self.add_manufacturer_data(manuf_code, data)
+        self.PropertiesChanged(LE_ADVERTISEMENT_IFACE,
+                {"ManufacturerData": self.get_properties()[LE_ADVERTISEMENT_IFACE]["ManufacturerData"]},
+                [])
+
+        return True
 
     @dbus.service.method(DBUS_PROP_IFACE,
                          in_signature="s",
@@ -111,24 +181,139 @@ class Advertisement(dbus.service.Object):
 
         return self.get_properties()[LE_ADVERTISEMENT_IFACE]
 
+    @dbus.service.signal(DBUS_PROP_IFACE,
+                         signature='sa{sv}as')
+    def PropertiesChanged(self, interface, changed, invalidated):
+        pass
+
     @dbus.service.method(LE_ADVERTISEMENT_IFACE,
                          in_signature='',
                          out_signature='')
     def Release(self):
         print ('%s: Released!' % self.path)
+        if self.released_callback is not None:
+            self.released_callback()
 
     def register_ad_callback(self):
         print("GATT advertisement registered")
+        if self.registered_callback is not None:
+            self.registered_callback()
 
-    def register_ad_error_callback(self):
-        print("Failed to register GATT advertisement")
+    def register_ad_error_callback(self, error):
+        print("Failed to register GATT advertisement: " + str(error))
+        if self.error_callback is not None:
+            self.error_callback(error)
 
-    def register(self):
-        bus = BleTools.get_bus()
-        adapter = BleTools.find_adapter(bus)
+    def register(self, adapter=None, callback=None, error_callback=None):
+        bus = self.bus
+        if adapter is None:
+            adapter = BleTools.find_adapter(bus)
+        self.registered_callback = callback
+        self.error_callback = error_callback
 
         ad_manager = dbus.Interface(bus.get_object(BLUEZ_SERVICE_NAME, adapter),
                                 LE_ADVERTISING_MANAGER_IFACE)
         ad_manager.RegisterAdvertisement(self.get_path(), {},
                                      reply_handler=self.register_ad_callback,
                                      error_handler=self.register_ad_error_callback)
+
+
+class AdvertisementManager(object):
+    """
+    Keeps an advertisement registered: re-registers it with backoff when the
+    registration fails, when BlueZ releases it, when the adapter is powered
+    back on and when bluetoothd restarts. A restarted bluetoothd has also
+    forgotten the GATT application, which is then registered again.
+    """
+    def __init__(self, advertisement, application=None):
+        self.ad = advertisement
+        self.application = application
+        self.app_lost = False
+        self.bus = advertisement.bus
+        self.adapter = None
+        self.registered = False
+        self.retry_delay = RETRY_MIN
+        self.retry_id = None
+        self.callback = None
+
+        self.ad.released_callback = self.released
+
+    def start(self, adapter=None, callback=None):
+        self.adapter = adapter
+        self.callback = callback
+        self.bus.add_signal_receiver(self.adapter_changed,
+                dbus_interface=DBUS_PROP_IFACE,
+                signal_name="PropertiesChanged",
+                arg0=ADAPTER_IFACE,
+                path_keyword="path")
+        self.bus.add_signal_receiver(self.bluez_owner_changed,
+                dbus_interface="org.freedesktop.DBus",
+                signal_name="NameOwnerChanged",
+                arg0=BLUEZ_SERVICE_NAME)
+        self.register()
+
+    def register(self):
+        self.retry_id = None
+        if self.adapter is None:
+            self.adapter = BleTools.find_adapter(self.bus)
+        if self.adapter is None:
+            print("No adapter found")
+            self.schedule_retry()
+            return False
+
+        if self.app_lost:
+            self.app_lost = False
+            print("re-register GATT application")
+            self.application.register(self.adapter)
+        self.ad.register(self.adapter,
+                         callback=self.registered_ok,
+                         error_callback=self.registration_failed)
+
+        return False
+
+    def registered_ok(self):
+        self.registered = True
+        self.retry_delay = RETRY_MIN
+        if self.callback is not None:
+            callback = self.callback
+            self.callback = None
+            callback()
+
+    def registration_failed(self, error):
+        self.registered = False
+        self.schedule_retry()
+
+    def schedule_retry(self):
+        if self.retry_id is not None:
+            return
+        print(f"re-register advertisement in {self.retry_delay} ms")
+        self.retry_id = GObject.timeout_add(self.retry_delay, self.register)
+        self.retry_delay = min(self.retry_delay * 2, RETRY_MAX)
+
+    def released(self):
+        self.registered = False
+        self.schedule_retry()
+
+    def adapter_changed(self, interface, changed, invalidated, path=None):
+        if "Powered" not in changed:
+            return
+        if not changed["Powered"]:
+            print("adapter powered off")
+            self.registered = False
+            return
+        print("adapter powered on")
+        # a power cycle drops every advertisement, start from a short delay
+        self.adapter = path
+        self.retry_delay = RETRY_MIN
+        self.schedule_retry()
+
+    def bluez_owner_changed(self, name, old_owner, new_owner):
+        if not new_owner:
+            print("bluetoothd went away")
+            self.registered = False
+            return
+        print("bluetoothd is back")
+        self.app_lost = self.application is not None
+        self.adapter = None
+        self.retry_delay = RETRY_MIN
+        self.schedule_retry()
@@ -0,0 +1,147 @@
+import threading
+
+# IR pulses the turntable needs per degree when nothing says otherwise
+PULSES_PER_DEGREE = 1
+# corrections smaller than this are left alone, in degrees
+TOLERANCE = 0.5
+
+
+class PositionReader(object):
+    """
+    Source of the measured turntable angle. read() returns the cumulative
+    angle in degrees since zero() was called, or None when there is no
+    reading.
+    """
+    def read(self):
+        return None
+
+    def zero(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FilePositionReader(PositionReader):
+    """
+    Reads the angle as text from the last line of a file or a named pipe,
+    for tests and for encoders handled by another process.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0.0
+
+    def read_raw(self):
+        try:
+            with open(self.path) as f:
+                lines = f.read().split()
+        except OSError:
+            return None
+        if not lines:
+            return None
+        try:
+            return float(lines[-1])
+        except ValueError:
+            return None
+
+    def read(self):
+        raw = self.read_raw()
+        if raw is None:
+            return None
+        return raw - self.offset
+
+    def zero(self):
+        raw = self.read_raw()
+        self.offset = raw if raw is not None else 0.0
+
+
+class QuadratureEncoderReader(PositionReader):
+    """
+    Counts the edges of a quadrature encoder wired to two GPIO pins.
+    """
+    # state transitions (previous << 2 | current) to count steps
+    TRANSITIONS = {0b0001: 1, 0b0111: 1, 0b1110: 1, 0b1000: 1,
+                   0b0010: -1, 0b1011: -1, 0b1101: -1, 0b0100: -1}
+
+    def __init__(self, pin_a, pin_b, counts_per_degree):
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+        self.pin_a = pin_a
+        self.pin_b = pin_b
+        self.counts_per_degree = counts_per_degree
+        self.count = 0
+        self.lock = threading.Lock()
+
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup([pin_a, pin_b], GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        self.state = self.pin_state()
+        GPIO.add_event_detect(pin_a, GPIO.BOTH, callback=self.edge)
+        GPIO.add_event_detect(pin_b, GPIO.BOTH, callback=self.edge)
+
+    def pin_state(self):
+        return (self.GPIO.input(self.pin_a) << 1) | self.GPIO.input(self.pin_b)
+
+    def edge(self, channel):
+        state = self.pin_state()
+        with self.lock:
+            self.count += self.TRANSITIONS.get((self.state << 2) | state, 0)
+            self.state = state
+
+    def read(self):
+        with self.lock:
+            return self.count / self.counts_per_degree
+
+    def zero(self):
+        with self.lock:
+            self.count = 0
+
+    def close(self):
+        self.GPIO.remove_event_detect(self.pin_a)
+        self.GPIO.remove_event_detect(self.pin_b)
+
+
+class AngleTracker(object):
+    """
+    Keeps the commanded angle of a session next to the measured one and
+    works out how many pulses the next step needs to cancel the drift.
+    """
+    def __init__(self, reader=None, pulses_per_degree=PULSES_PER_DEGREE,
+                 tolerance=TOLERANCE):
+        self.reader = reader if reader is not None else PositionReader()
+        self.pulses_per_degree = pulses_per_degree
+        self.tolerance = tolerance
+        self.start()
+
+    def start(self):
+        self.target = 0.0
+        self.commanded = 0
+        self.reader.zero()
+
+    def has_feedback(self):
+        return self.reader.read() is not None
+
+    def measured(self):
+        angle = self.reader.read()
+        if angle is None:
+            # open loop, assume every pulse landed
+            return self.commanded / self.pulses_per_degree
+        return angle
+
+    def error(self):
+        """Measured minus planned angle, in degrees."""
+        return self.measured() - self.target
+
+    def plan_step(self, degrees):
+        """
+        Move the target by degrees and return the pulses needed to reach it
+        from the measured position, never negative since the turntable only
+        turns one way.
+        """
+        self.target += degrees
+        missing = self.target - self.measured()
+        if abs(missing) < self.tolerance:
+            missing = 0
+        return max(0, int(round(missing * self.pulses_per_degree)))
+
+    def pulses_sent(self, pulses):
+        self.commanded += pulses
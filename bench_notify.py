@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+
+"""Compare the cost of a notification sent through a PropertiesChanged
+D-Bus signal with one sent over an AcquireNotify socket.
+
+Run on the Pi with the controller stopped:
+
+    python3 bench_notify.py [count]
+"""
+
+import socket
+import sys
+import time
+
+import dbus
+import dbus.service
+import dbus.mainloop.glib
+
+from service import Application, Service, Characteristic
+
+COUNT = 10000
+VALUE = "true"
+
+
+class BenchCharacteristic(Characteristic):
+    def __init__(self, service):
+        Characteristic.__init__(
+                self, "187fffff-44ad-4f56-bee4-23b6cac3fe46",
+                ["notify"], service, acquire_notify=True)
+
+
+def encode(data):
+    return [dbus.Byte(c.encode()) for c in data]
+
+
+def bench_signal(chrc, count):
+    start = time.perf_counter()
+    for i in range(count):
+        chrc.send_notify(encode(VALUE))
+    return time.perf_counter() - start
+
+
+def bench_socket(chrc, count):
+    local, remote = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    local.setblocking(False)
+    chrc.notify_sock = local
+    start = time.perf_counter()
+    for i in range(count):
+        chrc.send_notify(VALUE.encode())
+        # drain like bluetoothd would so the socket never fills up
+        remote.recv(64)
+    elapsed = time.perf_counter() - start
+    chrc.notify_sock = None
+    local.close()
+    remote.close()
+    return elapsed
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else COUNT
+
+    app = Application()
+    service = Service(0, "187ffffe-44ad-4f56-bee4-23b6cac3fe46", True)
+    chrc = BenchCharacteristic(service)
+
+    signal_time = bench_signal(chrc, count)
+    socket_time = bench_socket(chrc, count)
+
+    print("%d notifications" % count)
+    print("PropertiesChanged: %.1f us/notify" % (signal_time / count * 1e6))
+    print("AcquireNotify fd:  %.1f us/notify" % (socket_time / count * 1e6))
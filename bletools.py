@@ -49,8 +49,11 @@ class BleTools(object):
         return None
 
     @classmethod
-    def power_adapter(self):
-        adapter = self.get_adapter()
+    def power_adapter(self, bus=None, adapter=None):
+        if bus is None:
+            bus = self.get_bus()
+        if adapter is None:
+            adapter = self.find_adapter(bus)
 
         adapter_props = dbus.Interface(bus.get_object(BLUEZ_SERVICE_NAME, adapter),
                 "org.freedesktop.DBus.Properties");
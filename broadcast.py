@@ -0,0 +1,73 @@
+import struct
+import time
+try:
+  from gi.repository import GObject
+except ImportError:
+    import gobject as GObject
+
+# 0xFFFF is the company id reserved for testing. With the flags (3 bytes)
+# and the 128 bit service uuid (18) the manufacturer data (10) fills the 31
+# bytes of advertising data exactly, so the advertisement drops its tx power
+MANUFACTURER_ID = 0xFFFF
+# version, camera state, photo index, total photos
+STATUS = struct.Struct("<BBHH")
+STATUS_VERSION = 1
+STATE_CODES = {"idle": 0, "countdown": 1, "shooting": 2, "paused": 3,
+               "calibrating": 4}
+# minimum time between two advertisement updates, in s
+MIN_INTERVAL = 0.5
+
+
+def encode_status(state, photo_index, total):
+    return STATUS.pack(STATUS_VERSION, STATE_CODES.get(state, 0xFF),
+                       photo_index, total)
+
+
+def decode_status(data):
+    version, code, photo_index, total = STATUS.unpack(bytes(data))
+    states = {v: k for k, v in STATE_CODES.items()}
+    return states.get(code, "unknown"), photo_index, total
+
+
+class StatusBroadcaster(object):
+    """
+    Mirrors the camera status into the manufacturer data of the advertisement
+    so scanners can follow a session without connecting. Updates are
+    coalesced so the advertisement changes at most once per MIN_INTERVAL.
+    """
+    def __init__(self, advertisement, min_interval=MIN_INTERVAL):
+        self.ad = advertisement
+        self.min_interval = min_interval
+        self.last_update = 0
+        self.pending = None
+        self.timeout_id = None
+
+    def status_changed(self, service, event):
+        # called from the shooting threads, the advertisement lives on the
+        # mainloop
+        self.pending = encode_status(service.get_status(),
+                                     service.photo_index,
+                                     service.num_of_photos)
+        GObject.idle_add(self.flush)
+
+    def flush(self):
+        if self.pending is None or self.timeout_id is not None:
+            return False
+
+        wait = self.last_update + self.min_interval - time.monotonic()
+        if wait > 0:
+            self.timeout_id = GObject.timeout_add(int(wait * 1000) + 1,
+                                                  self.flush_timeout)
+            return False
+
+        data, self.pending = self.pending, None
+        self.last_update = time.monotonic()
+        self.ad.update_manufacturer_data(MANUFACTURER_ID, list(data))
+
+        return False
+
+    def flush_timeout(self):
+        self.timeout_id = None
+        self.flush()
+
+        return False
@@ -0,0 +1,139 @@
+import json
+import os
+import socket
+import time
+
+CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration.json")
+# how long the turntable spins while being measured, in s
+RUN_TIME = 10.0
+SAMPLE_INTERVAL = 0.05
+# speeds are measured over this long, in s
+WINDOW = 0.5
+# steady speed is reached within this fraction of the final speed
+SPEED_TOLERANCE = 0.05
+# below this the turntable is considered stopped, in degrees per second
+STILL_SPEED = 0.5
+MAX_SPIN_DOWN = 10.0
+
+
+class Calibration(object):
+    """
+    Measured behaviour of a freely spinning turntable: seconds to reach
+    steady speed, steady speed in degrees per second, seconds to stop and
+    degrees it still turns after the stop command.
+    """
+    def __init__(self, spin_up_time, speed, spin_down_time, coast_angle):
+        self.spin_up_time = spin_up_time
+        self.speed = speed
+        self.spin_down_time = spin_down_time
+        self.coast_angle = coast_angle
+
+    def interval_for(self, degrees):
+        """Shot interval that turns the plate by degrees between shots."""
+        return degrees / self.speed
+
+    def to_dict(self):
+        return {"spin_up_time": self.spin_up_time, "speed": self.speed,
+                "spin_down_time": self.spin_down_time,
+                "coast_angle": self.coast_angle}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["spin_up_time"], d["speed"], d["spin_down_time"],
+                   d["coast_angle"])
+
+    def __str__(self):
+        return (f"spin-up {self.spin_up_time:.2f}s, {self.speed:.2f} deg/s, "
+                f"spin-down {self.spin_down_time:.2f}s ({self.coast_angle:.1f} deg)")
+
+
+class CalibrationStore(object):
+    """Calibrations of several rigs in one JSON file, keyed by rig id."""
+    def __init__(self, path=CALIBRATION_FILE, rig_id=None):
+        self.path = path
+        self.rig_id = rig_id if rig_id is not None else socket.gethostname()
+
+    def load_all(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self):
+        data = self.load_all().get(self.rig_id)
+        return Calibration.from_dict(data) if data else None
+
+    def save(self, calibration):
+        data = self.load_all()
+        data[self.rig_id] = calibration.to_dict()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+def speeds(samples, window=WINDOW):
+    """(time, speed) over a sliding window of (time, angle) samples."""
+    result = []
+    j = 0
+    for t, angle in samples:
+        while samples[j][0] < t - window:
+            j += 1
+        t0, angle0 = samples[j]
+        if t > t0:
+            result.append((t, (angle - angle0) / (t - t0)))
+    return result
+
+
+def analyse(samples, started, stopped):
+    rate = speeds(samples)
+    running = [v for t, v in rate if started + WINDOW <= t <= stopped]
+    if not running:
+        return None
+    # the last half of the run is at steady speed
+    tail = sorted(running[len(running) // 2:])
+    speed = tail[len(tail) // 2]
+    if speed <= 0:
+        return None
+
+    spin_up_time = next((t - started for t, v in rate
+                         if t >= started + WINDOW and v >= speed * (1 - SPEED_TOLERANCE)),
+                        stopped - started)
+    # the window lags by half its width
+    spin_up_time = max(spin_up_time - WINDOW / 2, 0.0)
+    moving = [t for t, v in rate if t > stopped and v > STILL_SPEED]
+    spin_down_time = max(moving[-1] - stopped - WINDOW / 2, 0.0) if moving else 0.0
+    angle_at_stop = min(samples, key=lambda s: abs(s[0] - stopped))[1]
+    coast_angle = samples[-1][1] - angle_at_stop
+
+    return Calibration(spin_up_time, speed, spin_down_time, coast_angle)
+
+
+def calibrate(driver, reader, run_time=RUN_TIME, interval=SAMPLE_INTERVAL):
+    """
+    Spin the turntable and measure it with reader. Returns None when the
+    reader gives no position.
+    """
+    if reader.read() is None:
+        print("calibration needs a position sensor")
+        return None
+
+    samples = []
+    started = time.monotonic()
+    driver.start_continuous()
+    while time.monotonic() - started < run_time:
+        samples.append((time.monotonic(), reader.read()))
+        time.sleep(interval)
+
+    stopped = time.monotonic()
+    driver.stop()
+    while time.monotonic() - stopped < MAX_SPIN_DOWN:
+        samples.append((time.monotonic(), reader.read()))
+        time.sleep(interval)
+        if time.monotonic() - stopped > WINDOW:
+            recent = [a for t, a in samples if t >= samples[-1][0] - WINDOW]
+            if max(recent) - min(recent) < STILL_SPEED * WINDOW:
+                break
+
+    return analyse(samples, started, stopped)
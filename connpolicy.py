@@ -0,0 +1,234 @@
+"""Switch the BLE connection interval with the shooting phase.
+
+The shutter reaches the phone at the next connection event, so while a
+session runs the connected devices are asked for a short interval and once
+it is over for a long one, which saves power and airtime.
+
+BlueZ has no D-Bus API for connection parameters: connected devices are
+found through its ObjectManager, the update is requested with
+`hcitool lecup` and the values the central settles on are read from the
+LE Connection Update Complete events of a raw HCI socket.
+"""
+
+import queue
+import re
+import socket
+import struct
+import subprocess
+import threading
+
+BLUEZ_SERVICE_NAME = "org.bluez"
+DBUS_OM_IFACE = "org.freedesktop.DBus.ObjectManager"
+DEVICE_IFACE = "org.bluez.Device1"
+
+# min and max interval (1.25 ms units), peripheral latency (events),
+# supervision timeout (10 ms units)
+LOW_LATENCY = (6, 12, 0, 500)
+RELAXED = (80, 160, 4, 600)
+PHASES = {"shooting": LOW_LATENCY, "idle": RELAXED}
+# camera states that need the short interval
+SHOOTING_STATES = ("countdown", "shooting")
+
+HCI_EVENT_PKT = 0x04
+EVT_LE_META = 0x3E
+LE_CONN_COMPLETE = 0x01
+LE_CONN_UPDATE_COMPLETE = 0x03
+LE_ENHANCED_CONN_COMPLETE = 0x0A
+SOL_HCI = 0
+HCI_FILTER = 2
+
+
+def interval_ms(units):
+    return units * 1.25
+
+
+class HciConnectionUpdater(object):
+    """Requests connection parameters with hcitool; returns False on failure."""
+    def __init__(self, hci="hci0"):
+        self.hci = hci
+
+    def handles(self):
+        """{address: connection handle} of the open LE connections."""
+        output = subprocess.run(["hcitool", "-i", self.hci, "con"],
+                                capture_output=True, text=True).stdout
+        return {address: int(handle) for address, handle
+                in re.findall(r"LE ([0-9A-F:]{17}) handle (\d+)", output)}
+
+    def request(self, handle, params):
+        min_interval, max_interval, latency, timeout = params
+        result = subprocess.run(["hcitool", "-i", self.hci, "lecup",
+                                 "--handle", str(handle),
+                                 "--min", str(min_interval), "--max", str(max_interval),
+                                 "--latency", str(latency), "--timeout", str(timeout)],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"lecup on handle {handle} failed: {result.stderr.strip()}")
+            return False
+        return True
+
+
+class HciEventMonitor(object):
+    """
+    Calls callback(handle, interval, latency, timeout, address) for every LE
+    connection (update) complete event of the adapter, address is None for
+    updates. Needs CAP_NET_RAW.
+    """
+    def __init__(self, callback, dev_id=0):
+        self.callback = callback
+        self.sock = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_RAW, socket.BTPROTO_HCI)
+        # event packets, LE meta events only
+        hci_filter = struct.pack("<IIIH2x", 1 << HCI_EVENT_PKT, 0, 1 << (EVT_LE_META - 32), 0)
+        self.sock.setsockopt(SOL_HCI, HCI_FILTER, hci_filter)
+        self.sock.bind((dev_id,))
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                packet = self.sock.recv(260)
+            except OSError:
+                return
+            self.parse(packet)
+
+    def parse(self, packet):
+        if len(packet) < 4 or packet[0] != HCI_EVENT_PKT or packet[1] != EVT_LE_META:
+            return
+        subevent = packet[3]
+        address = None
+        if subevent == LE_CONN_UPDATE_COMPLETE:
+            status, handle, interval, latency, timeout = struct.unpack_from("<BHHHH", packet, 4)
+        elif subevent == LE_CONN_COMPLETE:
+            status, handle, _, _, peer, interval, latency, timeout = struct.unpack_from(
+                "<BHBB6sHHH", packet, 4)
+            address = ":".join(f"{b:02X}" for b in reversed(peer))
+        elif subevent == LE_ENHANCED_CONN_COMPLETE:
+            status, handle, _, _, peer, _, _, interval, latency, timeout = struct.unpack_from(
+                "<BHBB6s6s6sHHH", packet, 4)
+            address = ":".join(f"{b:02X}" for b in reversed(peer))
+        else:
+            return
+        if status == 0:
+            self.callback(handle & 0x0FFF, interval, latency, timeout, address)
+
+    def close(self):
+        self.sock.close()
+
+
+class ConnectionPolicy(object):
+    """
+    Follows the camera status and asks every connected device for the
+    parameters of the phase: LOW_LATENCY while counting down or shooting,
+    RELAXED otherwise. The D-Bus object manager, the updater and the event
+    monitor can be replaced, e.g. by fakes in tests.
+    """
+    def __init__(self, bus=None, adapter=None, manager=None, updater=None,
+                 monitor=True):
+        if manager is None:
+            import dbus
+            manager = dbus.Interface(bus.get_object(BLUEZ_SERVICE_NAME, "/"), DBUS_OM_IFACE)
+        self.manager = manager
+        self.adapter = adapter
+        self.updater = updater if updater is not None else HciConnectionUpdater()
+        self.phase = "idle"
+        # address -> {"phase", "requested", "negotiated"}
+        self.devices = {}
+        self.addresses = {}
+        self.lock = threading.Lock()
+        self.monitor = None
+        if monitor is True:
+            try:
+                self.monitor = HciEventMonitor(self.negotiated)
+            except OSError as e:
+                print(f"not following the negotiated connection parameters: {e}")
+        elif monitor:
+            self.monitor = monitor
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def status_changed(self, service, event):
+        # runs on the mainloop and the shooting threads, hcitool is left to
+        # the worker
+        if event not in ("state", "connection"):
+            return
+        phase = "shooting" if service.get_status() in SHOOTING_STATES else "idle"
+        if phase != self.phase or event == "connection":
+            self.phase = phase
+            self.requests.put(phase)
+
+    def run(self):
+        while True:
+            phase = self.requests.get()
+            if phase is None:
+                return
+            # only the latest phase matters
+            while not self.requests.empty():
+                phase = self.requests.get()
+                if phase is None:
+                    return
+            try:
+                self.apply(phase)
+            except Exception as e:
+                print(f"connection parameter update failed: {e}")
+
+    def connected_devices(self):
+        devices = []
+        for path, interfaces in self.manager.GetManagedObjects().items():
+            props = interfaces.get(DEVICE_IFACE)
+            if props is None or not props.get("Connected", False):
+                continue
+            if self.adapter is not None and not str(path).startswith(str(self.adapter) + "/"):
+                continue
+            devices.append(str(props["Address"]))
+        return devices
+
+    def apply(self, phase):
+        params = PHASES[phase]
+        devices = self.connected_devices()
+        with self.lock:
+            for address in list(self.devices):
+                if address not in devices:
+                    del self.devices[address]
+        if not devices:
+            return
+        handles = self.updater.handles()
+        for address in devices:
+            with self.lock:
+                device = self.devices.setdefault(address, {"phase": None, "requested": None,
+                                                           "negotiated": None})
+                if device["phase"] == phase:
+                    continue
+            handle = handles.get(address)
+            if handle is None:
+                continue
+            with self.lock:
+                self.addresses[handle] = address
+            if self.updater.request(handle, params):
+                with self.lock:
+                    device["phase"] = phase
+                    device["requested"] = params
+                print(f"{address}: asked for {interval_ms(params[0])}-{interval_ms(params[1])} ms "
+                      f"connection interval ({phase})")
+
+    def negotiated(self, handle, interval, latency, timeout, address=None):
+        with self.lock:
+            if address is not None:
+                # a new connection, it starts from scratch
+                self.addresses[handle] = address
+                self.devices[address] = {"phase": None, "requested": None, "negotiated": None}
+            address = self.addresses.get(handle)
+            if address is None or address not in self.devices:
+                return
+            self.devices[address]["negotiated"] = (interval, latency, timeout)
+        print(f"{address}: connection interval {interval_ms(interval)} ms, "
+              f"latency {latency}, timeout {timeout * 10} ms")
+
+    def stats(self):
+        with self.lock:
+            return {address: dict(device) for address, device in self.devices.items()}
+
+    def close(self):
+        self.requests.put(None)
+        if self.monitor is not None:
+            self.monitor.close()
@@ -21,70 +21,61 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import time
+IMPORT_START = time.monotonic()
+
 import dbus
+import dbus.mainloop.glib
+import argparse
+import signal
 import threading
 import sys
-import time
-import lirc
-from os import system
 
-from advertisement import Advertisement
+from advertisement import Advertisement, AdvertisementManager, MAX_AD_LENGTH
+from broadcast import StatusBroadcaster, MANUFACTURER_ID, encode_status
+from statusshm import StatusWriter, SHM_PATH
+from localapi import LocalApi, ShutterTrigger, API_SOCKET
+from bletools import BleTools
 from service import Application, Service, Characteristic, Descriptor
-from repeated_timer import RepeatedTimer
-from lirc import LircdConnection
+from engine import ShootingEngine, CAMERA_STATE, NUM_OF_PHOTOS
+from shotlog import PAGE_HEADER, RECORD
+from angle import FilePositionReader, QuadratureEncoderReader
+from calibration import CalibrationStore
+from profiler import Profiler, PROFILE_FILE
+from connpolicy import ConnectionPolicy
+from turntable import SerialTurntableDriver, GpioStepperDriver, SimulatedDriver
 
 GATT_CHRC_IFACE = "org.bluez.GattCharacteristic1"
 NOTIFY_TIMEOUT = 50
 DELAY_DETECT_MANUAL_SHUTDOWN = 1.0
 CONNECT_COUNTER_INTERVAL = 0.1
 
-# initial characteristic values
-MODE = "fixed_angle"
-NUM_OF_PHOTOS = 5
-TIME_INTERVAL = 2.0
-ANGLE = 3
-CAMERA_STATE = "idle"
-SHOULD_TAKE_PHOTO = "false"
-CONNECTED = 0
-
-# constants
-COUNT_DOWN_TIME = 3
-POSTPONE_TH_CD = 0.3
-START_ROTATING_CD = 2.0
-STOP_ROTATING_CD = 2.0
-ROT1DEG_CD = 1.0
-WAITING_HANDLER_CD = 2
+# bytes of ATT overhead in a read response
+ATT_READ_OVERHEAD = 1
+DEFAULT_MTU = 23
+
 
 class CameraAdvertisement(Advertisement):
     def __init__(self, index):
         Advertisement.__init__(self, index, "peripheral")
         self.add_local_name("CameraController")
-        self.include_tx_power = True
+        self.set_include_tx_power(True)
         self.add_service_uuid("187f0000-44ad-4f56-bee4-23b6cac3fe46")
 
-class CameraService(Service):
-    CAMERA_SVC_UUID = "187f0000-44ad-4f56-bee4-23b6cac3fe46"
-
-    def reset_characteristics(self):
-        self.mode = MODE
-        self.num_of_photos = NUM_OF_PHOTOS
-        self.time_interval = TIME_INTERVAL
-        self.angle = ANGLE
-        self.camera_state = CAMERA_STATE
-        self.should_take_photo = SHOULD_TAKE_PHOTO
-        self.connected = CONNECTED
-        self.lastConnected = CONNECTED
-        print("reset characteristics")
+    def add_status(self):
+        # flags, the 128 bit service uuid and the status take all 31 bytes,
+        # the tx power no longer fits
+        self.set_include_tx_power(False)
+        self.add_manufacturer_data(MANUFACTURER_ID,
+                list(encode_status(CAMERA_STATE, 0, NUM_OF_PHOTOS)))
 
-    def __init__(self, index):
-        self.reset_characteristics()
-        self.waitingHandler_th = threading.Timer(WAITING_HANDLER_CD, self.waitingHandler)
-        self.waitingHandler_th.start()
-        self.connectState = "waiting"
-        self.connectTimeout_th = threading.Timer(10, self.reset_characteristics)
-        # test on light strip
-        self.light_color = "red"
+class CameraService(ShootingEngine, Service):
+    CAMERA_SVC_UUID = "187f0000-44ad-4f56-bee4-23b6cac3fe46"
 
+    def __init__(self, index, position_reader=None, ir_device=None, driver=None,
+                 calibration_store=None, profiler=None):
+        ShootingEngine.__init__(self, position_reader, ir_device, driver,
+                                calibration_store, profiler)
         Service.__init__(self, index, self.CAMERA_SVC_UUID, True)
         self.add_characteristic(ModeCharacteristic(self))
         self.add_characteristic(NumOfPhotosCharacteristic(self))
@@ -93,182 +84,13 @@ class CameraService(Service):
         self.add_characteristic(CameraStateCharacteristic(self))
         self.add_characteristic(ShouldTakePhotoCharacteristic(self))
         self.add_characteristic(ConnectedCharacteristic(self))
-    
-    def set_mode(self, val):
-        self.mode = val
-
-    def set_num_of_photos(self, val):
-        self.num_of_photos = val
-
-    def set_time_interval(self, val):
-        self.time_interval = val
-
-    def set_angle(self, val):
-        self.angle = val
-
-    def get_camera_state(self):
-        return self.camera_state
-    
-    def set_camera_state(self, val):
-        self.camera_state = val
-        if val == "shooting":
-            self.start_shooting()
-        if val == "idle":
-            self.cancel_shooting()
-
-    def get_should_take_photo(self):
-        return self.should_take_photo
-    
-    def set_should_take_photo(self, val):
-        self.should_take_photo = val
-
-    def get_connected(self):
-        return self.connected
-
-    def set_connected(self, val):
-        self.connected = val
-
-    def count_down(self, cd_time):
-        if self.camera_state == "idle":
-            return
-        if self.connectState == "waiting":
-            self.cd_th = threading.Timer(POSTPONE_TH_CD, self.count_down, [cd_time])
-            print("wait count down")
-            self.cd_th.start()
-            return
-        if cd_time > 0:
-            print(cd_time)
-            self.cd_th = threading.Timer(1, self.count_down, [cd_time-1])
-            self.cd_th.start()
-        if cd_time <= 0:
-            if self.mode == "fixed_angle":
-                self.shooting_th = threading.Thread(target=self.shooting_fixed_angle, args=(0, 0))
-                self.shooting_th.start()
-            elif self.mode == "fixed_time_interval":
-                self.shooting_th = threading.Thread(target=self.shooting_fixed_time_interval, args=(0, "start"))
-                self.shooting_th.start()
-
-    def start_shooting(self):
-        self.cd_th = threading.Thread(target=self.count_down, args=(COUNT_DOWN_TIME,))
-        self.cd_th.start()
-
-    def cancel_shooting(self):
-        try:
-            if self.cd_th is not None:
-                self.cd_th.cancel()
-        except AttributeError:
-            pass
-        try:
-            if self.shooting_th is not None:
-                self.shooting_th.cancel()
-        except AttributeError:
-            pass
-
-    def shooting_fixed_angle(self, photo_cnt, angle_cnt):
-        if self.camera_state == "idle":
-            print("stop shooting_fixed_angle")
-            return 
-        if self.connectState == "waiting":
-            self.shooting_th = threading.Timer(POSTPONE_TH_CD, self.shooting_fixed_angle, [photo_cnt, angle_cnt])
-            self.shooting_th.start()
-            return
-        if photo_cnt >= self.num_of_photos:
-            self.camera_state = "idle"
-            print("camera state to idle")
-            return
-        if angle_cnt >= self.angle:
-            print("a photo has been shot.")
-            self.should_take_photo = "true"
-            self.shooting_th = threading.Timer(ROT1DEG_CD, self.shooting_fixed_angle, [photo_cnt+1, 0])
-            self.shooting_th.start()
-        else:
-            print("rotate the plate by 1 degree.")
-            system('irsend SEND_ONCE pisel KEY_1')
-            self.shooting_th = threading.Timer(ROT1DEG_CD, self.shooting_fixed_angle, [photo_cnt, angle_cnt+1])
-            self.shooting_th.start()
-
-    def shooting_fixed_time_interval(self, photo_cnt, state):
-        if self.camera_state == "idle":
-            print("stop shooting_fixed_time_interval")
-            return 
-        if self.connectState == "waiting":
-            self.shooting_th = threading.Timer(POSTPONE_TH_CD, self.shooting_fixed_time_interval, [photo_cnt, state])
-            self.shooting_th.start()
-            return
-        if state == "start":
-            print("start rotating...")
-            system('irsend SEND_ONCE pisel KEY_RESTART')
-            self.shooting_th = threading.Timer(START_ROTATING_CD, self.shooting_fixed_time_interval, [photo_cnt, "normal"])
-            self.shooting_th.start()
-            return
-        if state == "end":
-            self.camera_state = "idle"
-            print("camera state to idle")
-            return
-        if photo_cnt >= self.num_of_photos:
-            print("stop rotating...")
-            system('irsend SEND_ONCE pisel KEY_STOP')
-            self.shooting_th = threading.Timer(STOP_ROTATING_CD, self.shooting_fixed_time_interval, [photo_cnt, "end"])
-            self.shooting_th.start()
-            return
-        if photo_cnt == 0:
-            self.fixed_time_start = time.time()
-        print("a photo has been shot.")
-        self.should_take_photo = "true"
-        print(f"{time.time() - self.fixed_time_start:.3f}s after starting shooting_time_interval.")
-        self.shooting_th = threading.Timer(self.time_interval, self.shooting_fixed_time_interval, [photo_cnt+1, "normal"])
-        self.shooting_th.start()
-
-    def waitingHandler(self):
-        counter_diff = WAITING_HANDLER_CD / 0.4 - 1
-        if (self.connectState == "connected" and self.connected - self.lastConnected < counter_diff):
-            print("waiting to reconnect...")
-            self.connectState = "waiting"
-            self.connectTimeout_th.start()
-        elif (self.connectState == "waiting" and self.connected - self.lastConnected >= counter_diff):
-            self.connectState = "connected"
-            self.connectTimeout_th.cancel()
-            self.connectTimeout_th = threading.Timer(10, self.reset_characteristics)
-        self.lastConnected = self.connected
-        self.waitingHandler_th = threading.Timer(WAITING_HANDLER_CD, self.waitingHandler)
-        self.waitingHandler_th.start()
-
-    def change_light_color(self):
-        if self.light_color == "green":
-            system('irsend SEND_ONCE pisel KEY_2')
-            self.light_color = "red"
-        elif self.light_color == "red":
-            system('irsend SEND_ONCE pisel KEY_1')
-            self.light_color = "green"
-
-    def notify_disconnection(self):
-        self.set_connected(-1)
-
-    def cancel_threads(self):
-        try:
-            if self.cd_th is not None:
-                self.cd_th.cancel()
-        except AttributeError:
-            pass
-        try:
-            if self.shooting_th is not None:
-                self.shooting_th.cancel()
-        except AttributeError:
-            pass
-        try:
-            if self.waitingHandler_th is not None:
-                self.waitingHandler_th.cancel()
-        except AttributeError:
-            pass
-        try:
-            if self.connectTimeout_th is not None:
-                self.connectTimeout_th.cancel()
-        except AttributeError:
-            pass
-
-    def will_app_close(self):
-        self.notify_disconnection()
-        self.cancel_threads()
+        self.add_characteristic(ShotLogCharacteristic(self))
+        self.add_characteristic(AngleStepCharacteristic(self))
+        self.add_characteristic(SessionQueueCharacteristic(self))
+        if profiler is not None:
+            self.add_characteristic(ProfileCharacteristic(self))
+            for chrc in self.get_characteristics():
+                profiler.instrument_class(type(chrc), ["ReadValue", "WriteValue", "StartNotify"])
 
 class ModeCharacteristic(Characteristic):
     MODE_CHARACTERISTIC_UUID = "187f0001-44ad-4f56-bee4-23b6cac3fe46"
@@ -355,6 +177,62 @@ class AngleCharacteristic(Characteristic):
         except ValueError:
             print("Invalid value (cannot convert to <int>).")
 
+class AngleStepCharacteristic(Characteristic):
+    ANGLESTEP_CHARACTERISTIC_UUID = "187f0009-44ad-4f56-bee4-23b6cac3fe46"
+
+    def __init__(self, service):
+        Characteristic.__init__(
+                self, self.ANGLESTEP_CHARACTERISTIC_UUID,
+                ["write"], service)
+
+    def WriteValue(self, value, options):
+        try:
+            val = float(''.join([str(v) for v in value]))
+            print(f"'{val}' has been written")
+            if(val <= 0 or val > 45):
+                print("The angle step should be in range 0-45.")
+                return
+
+            self.service.set_angle_step(val)
+
+        except ValueError:
+            print("Invalid value (cannot convert to <float>).")
+
+class SessionQueueCharacteristic(Characteristic):
+    SESSIONQUEUE_CHARACTERISTIC_UUID = "187f000a-44ad-4f56-bee4-23b6cac3fe46"
+
+    def __init__(self, service):
+        Characteristic.__init__(
+                self, self.SESSIONQUEUE_CHARACTERISTIC_UUID,
+                ["read", "write"], service)
+
+    def ReadValue(self, options):
+        stats = self.service.session_stats()
+        data = "queued={queued};completed={completed};per_hour={per_hour:.1f}".format(**stats)
+
+        return [dbus.Byte(c.encode()) for c in data]
+
+    def WriteValue(self, value, options):
+        # "mode=fixed_angle;num_of_photos=24;angle=15;return_to_zero=1"
+        # queues a session, "clear" empties the queue
+        val = ''.join([str(v) for v in value])
+        if(val == "clear"):
+            print("Session queue cleared.")
+            self.service.clear_sessions()
+            return
+        try:
+            job = {}
+            for item in val.split(";"):
+                key, setting = item.split("=", 1)
+                job[key.strip()] = setting.strip()
+            for key in ("countdown", "return_to_zero"):
+                if key in job:
+                    job[key] = job[key] not in ("0", "false", "")
+            self.service.enqueue_session(job)
+
+        except ValueError as e:
+            print(f"Invalid session: {e}")
+
 class CameraStateCharacteristic(Characteristic):
     CAMERA_STATE_CHARACTERISTIC_UUID = "187f0005-44ad-4f56-bee4-23b6cac3fe46"
     def __init__(self, service):
@@ -407,6 +285,9 @@ class CameraStateCharacteristic(Characteristic):
         elif(val == "shooting"):
             print("Camera state has changed to 'shooting'.")
             self.service.set_camera_state(val)
+        elif(val == "calibrating"):
+            print("Calibrating the turntable.")
+            self.service.start_calibration()
         else:
             print("Invalid camera state input.")
         
@@ -418,7 +299,8 @@ class ShouldTakePhotoCharacteristic(Characteristic):
 
         Characteristic.__init__(
                 self, self.SHOULDTAKEPHOTO_CHARACTERISTIC_UUID,
-                ["notify", "read", "write"], service)
+                ["notify", "read", "write"], service,
+                acquire_notify=True, acquire_write=True)
 
     def get_should_take_photo(self):
         value = []
@@ -432,11 +314,11 @@ class ShouldTakePhotoCharacteristic(Characteristic):
 
     def set_should_take_photo_callback(self):
         # print("set_should_take_photo_callback")
-        if self.notifying:
+        if self.notifying or self.notify_sock is not None:
             value = self.get_should_take_photo()
-            self.PropertiesChanged(GATT_CHRC_IFACE, {"Value": value}, [])
+            self.send_notify(value)
 
-        return self.notifying
+        return self.notifying or self.notify_sock is not None
 
     def StartNotify(self):
         if self.notifying:
@@ -446,7 +328,14 @@ class ShouldTakePhotoCharacteristic(Characteristic):
         self.notifying = True
 
         value = self.get_should_take_photo()
-        self.PropertiesChanged(GATT_CHRC_IFACE, {"Value": value}, [])
+        self.send_notify(value)
+        self.add_timeout(NOTIFY_TIMEOUT, self.set_should_take_photo_callback)
+
+    def notify_acquired(self):
+        if self.notifying:
+            return
+
+        self.send_notify(self.get_should_take_photo())
         self.add_timeout(NOTIFY_TIMEOUT, self.set_should_take_photo_callback)
 
     def StopNotify(self):
@@ -474,7 +363,8 @@ class ConnectedCharacteristic(Characteristic):
 
         Characteristic.__init__(
                 self, self.CONNECTED_CHARACTERISTIC_UUID,
-                ["notify", "read", "write"], service)
+                ["notify", "read", "write"], service,
+                acquire_notify=True, acquire_write=True)
 
     def get_connected(self):
         value = []
@@ -490,12 +380,20 @@ class ConnectedCharacteristic(Characteristic):
 
         return value
 
-    def set_connected_callback(self):
-        if self.notifying:
+    def notify_connected(self):
+        if self.notify_sock is not None:
+            # the socket carries raw bytes, send the counter as text like the
+            # phone writes it
+            self.send_notify(str(self.service.get_connected()).encode())
+        else:
             value = self.get_connected()
             self.PropertiesChanged(GATT_CHRC_IFACE, {"Value": value}, [])
 
-        return self.notifying
+    def set_connected_callback(self):
+        if self.notifying or self.notify_sock is not None:
+            self.notify_connected()
+
+        return self.notifying or self.notify_sock is not None
 
     def StartNotify(self):
         if self.notifying:
@@ -503,8 +401,14 @@ class ConnectedCharacteristic(Characteristic):
 
         self.notifying = True
 
-        value = self.get_connected()
-        self.PropertiesChanged(GATT_CHRC_IFACE, {"Value": value}, [])
+        self.notify_connected()
+        self.add_timeout(NOTIFY_TIMEOUT, self.set_connected_callback)
+
+    def notify_acquired(self):
+        if self.notifying:
+            return
+
+        self.notify_connected()
         self.add_timeout(NOTIFY_TIMEOUT, self.set_connected_callback)
 
     def StopNotify(self):
@@ -526,19 +430,222 @@ class ConnectedCharacteristic(Characteristic):
         except:
             print("Invalid value.")
 
+class ShotLogCharacteristic(Characteristic):
+    SHOTLOG_CHARACTERISTIC_UUID = "187f0008-44ad-4f56-bee4-23b6cac3fe46"
+
+    def __init__(self, service):
+        # device -> [position of the next record, last page]
+        self.cursors = {}
+
+        Characteristic.__init__(
+                self, self.SHOTLOG_CHARACTERISTIC_UUID,
+                ["read", "write"], service)
+
+    def ReadValue(self, options):
+        # every read returns the next page, offsets > 0 are the rest of the
+        # last page when it did not fit into one response
+        cursor = self.cursors.setdefault(str(options.get("device", "")), [0, b""])
+        offset = int(options.get("offset", 0))
+        if offset == 0:
+            mtu = int(options.get("mtu", DEFAULT_MTU))
+            cursor[1] = self.service.get_shot_log_page(cursor[0], mtu - ATT_READ_OVERHEAD)
+            cursor[0] += (len(cursor[1]) - PAGE_HEADER.size) // RECORD.size
+        data = cursor[1][offset:]
+
+        return [dbus.Byte(b) for b in data]
 
-# start advertisement
-app = Application()
-app.add_service(CameraService(0))
-app.register()
+    def WriteValue(self, value, options):
+        # the position of the record the next read starts with
+        try:
+            val = int(''.join([str(v) for v in value]))
+            if(val < 0):
+                print("The shot log position should not be negative.")
+                return
+            self.cursors[str(options.get("device", ""))] = [val, b""]
 
-adv = CameraAdvertisement(0)
-adv.register()
+        except ValueError:
+            print("Invalid value (cannot convert to <int>).")
 
-try:
-    app_running = True
-    app.run()
+class ProfileCharacteristic(Characteristic):
+    PROFILE_CHARACTERISTIC_UUID = "187f000b-44ad-4f56-bee4-23b6cac3fe46"
 
-except KeyboardInterrupt:
-    app.services[0].will_app_close()
-    app.quit()
+    def __init__(self, service):
+        Characteristic.__init__(
+                self, self.PROFILE_CHARACTERISTIC_UUID,
+                ["write"], service)
+
+    def WriteValue(self, value, options):
+        val = ''.join([str(v) for v in value])
+        if(val == "dump"):
+            self.service.profiler.request_dump()
+        else:
+            print("Invalid profile command.")
+
+
+class StartupProfile(object):
+    def __init__(self, start):
+        self.start = start
+        self.last = start
+        self.sent = start
+        self.steps = []
+        self.pending = set()
+
+    def mark(self, step):
+        now = time.monotonic()
+        self.steps.append((step, now - self.last))
+        self.last = now
+
+    def expect(self, *steps):
+        self.pending.update(steps)
+
+    def done(self, step):
+        # registration replies arrive in any order, time them from the
+        # moment both requests went out
+        now = time.monotonic()
+        self.steps.append((step, now - self.sent))
+        self.pending.discard(step)
+        if not self.pending:
+            self.report(now)
+
+    def report(self, now):
+        steps = ", ".join(f"{name} {t:.3f}s" for name, t in self.steps)
+        print(f"startup: {steps}, total {now - self.start:.3f}s")
+
+
+def pins_and_scale(value):
+    # "PIN,PIN,SCALE" as used by --stepper and --encoder
+    try:
+        pin_a, pin_b, scale = value.split(",")
+        return int(pin_a), int(pin_b), float(scale)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected PIN,PIN,NUMBER, got '{value}'")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Turntable capture controller")
+    parser.add_argument("--no-broadcast", dest="broadcast", action="store_false",
+                        help="do not mirror the camera status in the advertisement")
+    parser.add_argument("--shm", metavar="PATH", default=SHM_PATH,
+                        help=f"shared memory status block for local processes (default: {SHM_PATH})")
+    parser.add_argument("--no-shm", dest="shm", action="store_const", const=None,
+                        help="do not publish the status in shared memory")
+    parser.add_argument("--api-socket", metavar="PATH", default=API_SOCKET,
+                        help=f"Unix socket of the local control API (default: {API_SOCKET})")
+    parser.add_argument("--no-api", dest="api_socket", action="store_const", const=None,
+                        help="do not serve the local control API")
+    parser.add_argument("--trigger-command", metavar="CMD",
+                        help="shell command that fires a local camera on every shot, e.g. 'gphoto2 --trigger-capture'")
+    parser.add_argument("--ir-device", metavar="PATH",
+                        help="write IR pulse trains to this /dev/lirc* device instead of going through lircd")
+    parser.add_argument("--driver", choices=["ir", "serial", "stepper", "sim"], default="ir",
+                        help="how the turntable is driven (default: ir)")
+    parser.add_argument("--serial-port", metavar="PATH", default="/dev/ttyUSB0",
+                        help="serial port of the turntable controller")
+    parser.add_argument("--stepper", metavar="STEP_PIN,DIR_PIN,STEPS_PER_DEGREE", type=pins_and_scale,
+                        help="GPIO pins (BCM) and resolution of the stepper driver")
+    parser.add_argument("--rig-id", metavar="NAME",
+                        help="name the turntable calibration is stored under (default: hostname)")
+    parser.add_argument("--position-file", metavar="PATH",
+                        help="read the turntable angle from a file or pipe")
+    parser.add_argument("--encoder", metavar="PIN_A,PIN_B,COUNTS_PER_DEGREE", type=pins_and_scale,
+                        help="read the turntable angle from a quadrature encoder")
+    parser.add_argument("--no-conn-policy", dest="conn_policy", action="store_false",
+                        help="do not shorten the BLE connection interval while shooting")
+    parser.add_argument("--profile", metavar="PATH", nargs="?", const=PROFILE_FILE,
+                        help=f"sample stacks, time GATT calls and shooting steps; SIGUSR1 writes collapsed stacks to PATH (default: {PROFILE_FILE})")
+    args = parser.parse_args()
+    if args.driver == "stepper" and args.stepper is None:
+        parser.error("--driver stepper needs --stepper STEP_PIN,DIR_PIN,STEPS_PER_DEGREE")
+    return args
+
+
+def turntable_driver(args):
+    if args.driver == "serial":
+        return SerialTurntableDriver(args.serial_port)
+    if args.driver == "stepper":
+        step_pin, dir_pin, steps = args.stepper
+        return GpioStepperDriver(step_pin, dir_pin, steps)
+    if args.driver == "sim":
+        return SimulatedDriver()
+    # the IR driver is built by CameraService around its IR queue
+    return None
+
+
+def position_reader(args, driver):
+    if args.encoder:
+        pin_a, pin_b, counts = args.encoder
+        return QuadratureEncoderReader(pin_a, pin_b, counts)
+    if args.position_file:
+        return FilePositionReader(args.position_file)
+    if isinstance(driver, SimulatedDriver):
+        return driver
+    return None
+
+
+def main():
+    profile = StartupProfile(IMPORT_START)
+    args = parse_args()
+    profile.mark("import")
+
+    dbus.mainloop.glib.threads_init()
+    app = Application()
+    profile.mark("bus connect")
+
+    # look the adapter up while the GATT objects are being built
+    adapter = []
+    adapter_th = threading.Thread(target=lambda: adapter.append(BleTools.find_adapter(app.bus)))
+    adapter_th.start()
+    driver = turntable_driver(args)
+    profiler = None
+    if args.profile:
+        profiler = Profiler(args.profile)
+        profiler.start_watchdog()
+        # the handler runs once the mainloop is back in Python, at the
+        # latest on the next watchdog beat, and leaves the dump to a thread
+        signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.request_dump())
+    camera = CameraService(0, position_reader(args, driver), args.ir_device, driver,
+                           CalibrationStore(rig_id=args.rig_id), profiler)
+    app.add_service(camera)
+    adv = CameraAdvertisement(0)
+    adv_manager = AdvertisementManager(adv, app)
+    if args.broadcast:
+        adv.add_status()
+        camera.add_status_listener(StatusBroadcaster(adv).status_changed)
+    if adv.data_length() > MAX_AD_LENGTH:
+        print(f"advertising data is {adv.data_length()} bytes, BlueZ will refuse more than {MAX_AD_LENGTH}")
+    if args.shm:
+        status_writer = StatusWriter(args.shm)
+        status_writer.status_changed(camera, "state")
+        camera.add_status_listener(status_writer.status_changed)
+    api = LocalApi(camera, args.api_socket) if args.api_socket else None
+    if args.trigger_command:
+        ShutterTrigger(camera, args.trigger_command)
+    adapter_th.join()
+    profile.mark("adapter lookup")
+    conn_policy = None
+    if args.conn_policy:
+        conn_policy = ConnectionPolicy(app.bus, adapter[0])
+        camera.add_status_listener(conn_policy.status_changed)
+
+    profile.expect("register", "advertise")
+    profile.sent = time.monotonic()
+    app.register(adapter[0], callback=lambda: profile.done("register"))
+    adv_manager.start(adapter[0], callback=lambda: profile.done("advertise"))
+
+    try:
+        app.run()
+
+    except KeyboardInterrupt:
+        app.services[0].will_app_close()
+        if api is not None:
+            api.close()
+        if conn_policy is not None:
+            conn_policy.close()
+        if profiler is not None:
+            profiler.dump()
+            profiler.stop()
+        app.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,725 @@
+"""
+The shooting engine: the camera settings, the session queue and the steps
+that turn the plate and take the photos. It knows nothing about BLE, the
+GATT service in control.py wraps it.
+"""
+
+import collections
+import math
+import os
+import threading
+import time
+
+from shotlog import ShotLog
+from angle import AngleTracker
+from calibration import calibrate
+from turntable import IrTurntableDriver
+
+# initial characteristic values
+MODE = "fixed_angle"
+NUM_OF_PHOTOS = 5
+TIME_INTERVAL = 2.0
+ANGLE = 3
+CAMERA_STATE = "idle"
+SHOULD_TAKE_PHOTO = "false"
+CONNECTED = 0
+
+# constants
+COUNT_DOWN_TIME = 3
+ROT1DEG_CD = 1.0
+# slack when comparing countdown times, in s
+TICK_EPSILON = 0.001
+# extra correction rounds per shot before shooting anyway
+MAX_CORRECTIONS = 3
+WAITING_HANDLER_CD = 2
+REMOTE_NAME = "pisel"
+LIRCD_CONF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pisel.lircd.conf")
+
+
+def validate_session(config, calibration=None):
+    """
+    Check session settings and return them converted, with angle_step
+    turned into a time_interval as well. Raises ValueError, changes nothing.
+    """
+    if not isinstance(config, dict):
+        raise ValueError("session settings should be an object")
+    # countdown and return_to_zero are only used by the session queue
+    unknown = set(config) - {"mode", "num_of_photos", "time_interval", "angle", "angle_step",
+                             "countdown", "return_to_zero"}
+    if unknown:
+        raise ValueError(f"unknown settings: {', '.join(sorted(unknown))}")
+    settings = {}
+    try:
+        if "mode" in config:
+            settings["mode"] = config["mode"]
+        if "num_of_photos" in config:
+            settings["num_of_photos"] = int(config["num_of_photos"])
+        if "time_interval" in config:
+            settings["time_interval"] = float(config["time_interval"])
+        if "angle" in config:
+            settings["angle"] = int(config["angle"])
+        if "angle_step" in config:
+            angle_step = float(config["angle_step"])
+    except (TypeError, ValueError):
+        raise ValueError("settings should be numbers")
+    if settings.get("mode", "fixed_angle") not in ("fixed_angle", "fixed_time_interval"):
+        raise ValueError("mode should be 'fixed_angle' or 'fixed_time_interval'")
+    if not 1 <= settings.get("num_of_photos", 1) <= 200:
+        raise ValueError("Number of photos should be in range 1-200.")
+    if not 1 <= settings.get("angle", 1) <= 45:
+        raise ValueError("The angle should be in range 1-45.")
+    if "angle_step" in config:
+        if not 0 < angle_step <= 45:
+            raise ValueError("The angle step should be in range 0-45.")
+        if calibration is None:
+            raise ValueError("The turntable has not been calibrated.")
+        settings["angle_step"] = angle_step
+        settings["time_interval"] = calibration.interval_for(angle_step)
+    # also holds for the interval derived from angle_step
+    if not 2.0 <= settings.get("time_interval", 2.0) <= 20.0:
+        raise ValueError("Time interval should be in range 2.0-20.0 .")
+    return settings
+
+
+class ShootingEngine(object):
+    """
+    Runs the sessions on the turntable driver. A step at a time is pending
+    on a timer; engine_lock guards the state the steps and the callers share.
+    """
+    def reset_characteristics(self):
+        self.mode = MODE
+        self.num_of_photos = NUM_OF_PHOTOS
+        self.time_interval = TIME_INTERVAL
+        self.angle = ANGLE
+        # set when the time_interval was derived from an angle step
+        self.angle_step = None
+        self.camera_state = CAMERA_STATE
+        self.should_take_photo = SHOULD_TAKE_PHOTO
+        self.connected = CONNECTED
+        self.lastConnected = CONNECTED
+        print("reset characteristics")
+
+    def __init__(self, position_reader=None, ir_device=None, driver=None,
+                 calibration_store=None, profiler=None):
+        self.status_listeners = []
+        self.profiler = profiler
+        self.photo_index = 0
+        self.counting_down = False
+        self.engine_lock = threading.RLock()
+        self.shooting_th = None
+        self.pending = None
+        self.paused = False
+        self.parked = None
+        self.spinning = False
+        self.sessions = collections.deque()
+        self.session_start = None
+        self.run_start = None
+        self.run_end = None
+        self.completed_sessions = 0
+        self.busy_time = 0.0
+        self.local_triggers = 0
+        self.waiting_ack = False
+        self.pause_spinning = False
+        self.pause_angle = 0.0
+        self.pause_time = 0.0
+        self.fixed_time_start = time.time()
+        self.reset_characteristics()
+        self.waitingHandler_th = threading.Timer(WAITING_HANDLER_CD, self.waitingHandler)
+        self.waitingHandler_th.start()
+        self.connectState = "waiting"
+        self.connectTimeout_th = threading.Timer(10, self.connect_timeout)
+        # test on light strip
+        self.light_color = "red"
+        self.shot_log = ShotLog()
+        self.step_due = time.time()
+        self.tracker = AngleTracker(position_reader)
+        self.corrections = 0
+        self.ir = None
+        self.ir_device = ir_device
+        self.driver = driver if driver is not None else IrTurntableDriver(self.get_ir)
+        self.calibration_store = calibration_store
+        self.calibration = calibration_store.load() if calibration_store else None
+        self.apply_calibration()
+    
+    def add_status_listener(self, listener):
+        self.status_listeners.append(listener)
+
+    def publish_status(self, event):
+        for listener in self.status_listeners:
+            try:
+                listener(self, event)
+            except Exception as e:
+                print(f"status listener failed: {e}")
+
+    def get_status(self):
+        if self.camera_state == "calibrating":
+            return "calibrating"
+        if self.camera_state != "shooting":
+            return "idle"
+        if self.paused:
+            return "paused"
+        if self.counting_down:
+            return "countdown"
+        return "shooting"
+
+    def get_ir(self):
+        # the IR backend is only needed once shooting starts, keep it off the
+        # start-up path
+        if self.ir is None:
+            import lircd
+            from irqueue import IrQueue
+            remote = lircd.parse(LIRCD_CONF)[REMOTE_NAME]
+            if self.ir_device:
+                sender = lircd.LircDevice(remote, self.ir_device)
+            else:
+                from ir import IrSender
+                sender = IrSender(remote.name)
+            if self.profiler is not None:
+                self.profiler.instrument_object(sender, ["send_once"])
+            self.ir = IrQueue(sender, remote.gap, remote.keys())
+        return self.ir
+
+    def send_ir(self, key):
+        self.get_ir().send(key)
+
+    def print_ir_stats(self):
+        if self.ir is None:
+            return
+        stats = self.ir.stats()
+        print("IR queue: {sent} sends, {frames} frames, {coalesced} coalesced, "
+              "{rejected} rejected, max depth {max_depth}, "
+              "wait {mean_wait:.3f}s mean / {max_wait:.3f}s max".format(**stats))
+
+    def set_mode(self, val):
+        self.mode = val
+
+    def set_num_of_photos(self, val):
+        self.num_of_photos = val
+
+    def set_time_interval(self, val):
+        self.time_interval = val
+        self.angle_step = None
+
+    def set_angle(self, val):
+        self.angle = val
+        self.angle_step = None
+
+    def step_angle(self):
+        # degrees between shots in fixed_time_interval mode
+        return self.angle if self.angle_step is None else self.angle_step
+
+    def apply_session(self, config):
+        """
+        Validate and apply session settings given as a dict with any of mode,
+        num_of_photos, time_interval, angle and angle_step.
+        """
+        settings = validate_session(config, self.calibration)
+        if "mode" in settings:
+            self.set_mode(settings["mode"])
+        if "num_of_photos" in settings:
+            self.set_num_of_photos(settings["num_of_photos"])
+        if "time_interval" in settings:
+            self.set_time_interval(settings["time_interval"])
+        if "angle" in settings:
+            self.set_angle(settings["angle"])
+        if "angle_step" in settings:
+            self.angle_step = settings["angle_step"]
+
+    def enqueue_session(self, config):
+        self.enqueue_sessions([config])
+
+    def enqueue_sessions(self, configs):
+        # validate now rather than when the sessions come up, all of them
+        # before any is queued
+        for config in configs:
+            validate_session(config, self.calibration)
+        with self.engine_lock:
+            self.sessions.extend(dict(config) for config in configs)
+            print(f"{len(configs)} session(s) queued ({len(self.sessions)} waiting)")
+            started = self.start_next_session()
+        if started:
+            self.publish_status("state")
+
+    def queued_sessions(self):
+        return len(self.sessions)
+
+    def clear_sessions(self):
+        self.sessions.clear()
+
+    def start_next_session(self, follow_up=False):
+        """
+        Start the next queued session if the camera is idle. A follow-up of
+        a session that just ended starts right away, without countdown
+        unless the job asks for one, after turning the plate back to where
+        the last session began if the job sets return_to_zero. The caller
+        publishes the state.
+        """
+        with self.engine_lock:
+            if self.camera_state != "idle":
+                return False
+            if not self.sessions:
+                if follow_up:
+                    self.run_end = time.time()
+                    self.print_session_stats()
+                return False
+            job = self.sessions.popleft()
+            self.apply_session(job)
+            countdown = COUNT_DOWN_TIME if job.get("countdown", not follow_up) else 0
+            pre_rotate = 0
+            if follow_up and job.get("return_to_zero"):
+                pre_rotate = int(round(-self.tracker.measured() % 360)) % 360
+            print(f"starting the next session ({len(self.sessions)} left)")
+            self.camera_state = "shooting"
+            self.start_shooting(countdown, pre_rotate)
+            return True
+
+    def session_stats(self):
+        # over the current run of back-to-back sessions, or the last one
+        elapsed = (self.run_end or time.time()) - self.run_start if self.run_start else 0.0
+        return {
+            "queued": len(self.sessions),
+            "completed": self.completed_sessions,
+            "per_hour": self.completed_sessions / (elapsed / 3600) if elapsed else 0.0,
+            "busy": self.busy_time / elapsed if elapsed else 0.0,
+        }
+
+    def print_session_stats(self):
+        stats = self.session_stats()
+        print("sessions: {completed} done, {per_hour:.1f} per hour, "
+              "{busy:.0%} of the time shooting".format(**stats))
+
+    def add_local_trigger(self):
+        self.local_triggers += 1
+
+    def remove_local_trigger(self):
+        self.local_triggers = max(self.local_triggers - 1, 0)
+
+    def set_angle_step(self, val):
+        try:
+            self.apply_session({"angle_step": val})
+        except ValueError as e:
+            print(f"Cannot set an angle step of {val} degree(s): {e}")
+            return
+        print(f"time_interval has been set to {self.time_interval:.3f} for {val} degree(s) per shot")
+
+    def apply_calibration(self):
+        if self.calibration is None:
+            return
+        # measured times replace the driver's guesses
+        self.driver.spin_up_time = self.calibration.spin_up_time
+        self.driver.spin_down_time = self.calibration.spin_down_time
+        print(f"calibration: {self.calibration}")
+
+    def start_calibration(self):
+        with self.engine_lock:
+            if self.camera_state != "idle":
+                print("Cannot calibrate while shooting.")
+                return
+            self.camera_state = "calibrating"
+        self.publish_status("state")
+        threading.Thread(target=self.run_calibration).start()
+
+    def run_calibration(self):
+        try:
+            result = calibrate(self.driver, self.tracker.reader)
+        except Exception as e:
+            print(f"calibration failed: {e}")
+            result = None
+        if result is not None:
+            self.calibration = result
+            if self.calibration_store is not None:
+                self.calibration_store.save(result)
+            self.apply_calibration()
+        with self.engine_lock:
+            self.camera_state = "idle"
+            # jobs queued while calibrating
+            self.start_next_session()
+        self.publish_status("state")
+
+    def get_camera_state(self):
+        return self.camera_state
+    
+    def set_camera_state(self, val):
+        with self.engine_lock:
+            if self.camera_state == "calibrating":
+                # the calibration drives the turntable until it is done
+                print("Cannot change the camera state while calibrating.")
+                return
+            self.camera_state = val
+            if val == "shooting":
+                self.start_shooting()
+            if val == "idle":
+                self.cancel_shooting()
+        self.publish_status("state")
+
+    def get_should_take_photo(self):
+        return self.should_take_photo
+    
+    def set_should_take_photo(self, val):
+        if val == "false" and self.should_take_photo == "true":
+            self.shot_log.ack_last()
+            if self.local_triggers:
+                self.hurry()
+        self.should_take_photo = val
+
+    def hurry(self):
+        # a local trigger says when the shot is done, no need to sit out the
+        # rest of the fixed wait after it
+        with self.engine_lock:
+            # a step that has already started is no longer pending
+            if not self.waiting_ack or self.paused or self.pending is None:
+                return
+            step, args, due = self.pending
+            self.shooting_th.cancel()
+            self.schedule(0, step, *args)
+
+    def get_shot_log_page(self, first, size):
+        return self.shot_log.read_page(first, size)
+
+    def get_connected(self):
+        return self.connected
+
+    def set_connected(self, val):
+        self.connected = val
+
+    def schedule(self, delay, step, *args):
+        """
+        Run the next step of the sequence after delay seconds. While paused
+        the step is parked instead and run again by resume().
+        """
+        with self.engine_lock:
+            if self.paused:
+                self.parked = (step, args, delay)
+                return
+            self.pending = (step, args, time.monotonic() + delay)
+            self.waiting_ack = False
+            self.shooting_th = threading.Timer(delay, self.run_step, (self.pending,))
+            self.shooting_th.start()
+
+    def run_step(self, entry):
+        # Timer.cancel() cannot stop a timer that has already fired: a step
+        # only runs while it is still the pending one
+        with self.engine_lock:
+            if self.pending is not entry:
+                return
+            self.pending = None
+        step, args, due = entry
+        if self.profiler is not None:
+            self.profiler.run_step(step, args, due)
+        else:
+            step(*args)
+
+    def pause(self):
+        with self.engine_lock:
+            if self.camera_state != "shooting" or self.paused:
+                return
+            if self.local_triggers:
+                # the phone is not needed to take the photos
+                return
+            self.paused = True
+            if self.shooting_th is not None:
+                self.shooting_th.cancel()
+            if self.pending is not None:
+                step, args, due = self.pending
+                self.parked = (step, args, max(due - time.monotonic(), 0.0))
+                self.pending = None
+            self.pause_spinning = self.spinning
+            if self.spinning:
+                self.driver.stop()
+                self.spinning = False
+            self.pause_angle = self.tracker.measured()
+            self.pause_time = time.time()
+        print(f"paused at {self.pause_angle:.1f} degree, photo {self.photo_index}.")
+        self.publish_status("state")
+
+    def resume(self):
+        with self.engine_lock:
+            if not self.paused:
+                return
+            self.paused = False
+            parked, self.parked = self.parked, None
+            if self.camera_state != "shooting" or parked is None:
+                return
+            step, args, remaining = parked
+            delay = remaining
+            if self.pause_spinning:
+                delay = self.respin_delay(remaining)
+                self.driver.start_continuous(self.continuous_speed())
+                self.spinning = True
+                # keep the scheduled shot times of the log in step
+                self.fixed_time_start += time.time() - self.pause_time + delay - remaining
+        print(f"resumed at {self.tracker.measured():.1f} degree, next step in {delay:.2f}s.")
+        self.schedule(delay, step, *args)
+        self.publish_status("state")
+
+    def respin_delay(self, remaining):
+        # The table coasted on after the stop and turns slower while it spins
+        # up again. Assuming a linear spin-up, it covers half its steady
+        # speed times spin_up_time before reaching speed.
+        if self.calibration is None:
+            return remaining + self.driver.spin_up_time
+        speed = self.calibration.speed
+        delay = remaining - self.calibration.coast_angle / speed + self.driver.spin_up_time / 2
+        return max(delay, self.driver.spin_up_time / 2)
+
+    def spin_up_lead(self):
+        # in fixed_time_interval mode the turntable is started during the
+        # countdown so it is at speed when it ends
+        if self.mode == "fixed_time_interval":
+            return self.driver.spin_up_time
+        return 0.0
+
+    def count_down(self, cd_time):
+        # cd_time is the time left until the first shot, ticks land on whole
+        # seconds and on the moment the turntable has to start spinning
+        if self.camera_state == "idle":
+            return
+        lead = self.spin_up_lead()
+        if self.mode == "fixed_time_interval" and not self.spinning and cd_time <= lead + TICK_EPSILON:
+            print("start rotating...")
+            self.driver.start_continuous(self.continuous_speed())
+            self.spinning = True
+        if cd_time > TICK_EPSILON:
+            if abs(cd_time - round(cd_time)) < TICK_EPSILON:
+                print(round(cd_time))
+            next_time = math.ceil(cd_time - TICK_EPSILON) - 1
+            if not self.spinning and next_time < lead < cd_time:
+                next_time = lead
+            self.schedule(cd_time - next_time, self.count_down, max(next_time, 0))
+            return
+        self.counting_down = False
+        self.publish_status("state")
+        if self.mode == "fixed_angle":
+            self.shooting_fixed_angle(0, None)
+        elif self.mode == "fixed_time_interval":
+            self.fixed_time_start = time.time()
+            self.shooting_fixed_time_interval(0, "normal")
+
+    def countdown_time(self, countdown):
+        # never shorter than the spin-up it hides
+        return max(countdown, self.spin_up_lead())
+
+    def start_shooting(self, countdown=COUNT_DOWN_TIME, pre_rotate=0):
+        if self.connectState == "waiting" and not self.local_triggers:
+            # nobody takes the photos yet, the first step is parked until
+            # the phone shows up
+            with self.engine_lock:
+                self.paused = True
+                self.pause_spinning = False
+                self.pause_angle = self.tracker.measured()
+                self.pause_time = time.time()
+            print("waiting for the phone before shooting.")
+        self.shot_log.start()
+        self.photo_index = 0
+        self.session_start = time.time()
+        if self.run_start is None or self.run_end is not None:
+            self.run_start = self.session_start
+            self.run_end = None
+            self.completed_sessions = 0
+            self.busy_time = 0.0
+        if pre_rotate:
+            self.schedule(0, self.return_to_zero, pre_rotate, countdown)
+            return
+        self.tracker.start()
+        self.counting_down = True
+        self.schedule(0, self.count_down, self.countdown_time(countdown))
+
+    def return_to_zero(self, degrees_left, countdown):
+        if self.camera_state == "idle":
+            return
+        self.driver.wait_idle()
+        if degrees_left <= 0:
+            print("back at zero.")
+            self.tracker.start()
+            self.counting_down = True
+            self.count_down(self.countdown_time(countdown))
+            return
+        step = degrees_left if self.driver.absolute_moves else 1
+        self.driver.rotate(step)
+        self.schedule(self.driver.move_time(step), self.return_to_zero, degrees_left - step, countdown)
+
+    def cancel_shooting(self):
+        with self.engine_lock:
+            self.counting_down = False
+            self.paused = False
+            self.parked = None
+            self.pending = None
+            if self.shooting_th is not None:
+                self.shooting_th.cancel()
+            if self.spinning:
+                self.driver.stop()
+                self.spinning = False
+
+    def shooting_fixed_angle(self, photo_cnt, pulses_left):
+        # pulses_left is None at the start of a step, the pulses are then
+        # planned from the measured angle so earlier drift is corrected
+        if self.camera_state == "idle":
+            print("stop shooting_fixed_angle")
+            return 
+        # never plan or shoot while the plate is still moving
+        waited = self.driver.wait_idle()
+        if waited > 0.001:
+            print(f"waited {waited:.3f}s for the turntable to stop.")
+        if photo_cnt >= self.num_of_photos:
+            self.finish_shooting()
+            return
+        if pulses_left is None:
+            self.corrections = 0
+            pulses_left = self.tracker.plan_step(self.angle)
+        if pulses_left <= 0 and self.corrections < MAX_CORRECTIONS and self.tracker.has_feedback():
+            # frames can get lost, top up until the sensor agrees
+            pulses_left = self.tracker.plan_step(0)
+            if pulses_left > 0:
+                self.corrections += 1
+                print(f"{self.tracker.error():.1f} degree behind, {pulses_left} extra pulse(s).")
+        if pulses_left <= 0:
+            print("a photo has been shot.")
+            self.should_take_photo = "true"
+            error = self.tracker.error() if self.tracker.has_feedback() else float("nan")
+            self.shot_log.add_shot(photo_cnt, self.tracker.measured(), self.step_due, error=error)
+            print(f"cumulative angle error: {error:.1f} degree.")
+            self.photo_index = photo_cnt + 1
+            self.publish_status("shot")
+            self.step_due = time.time() + ROT1DEG_CD
+            self.schedule(ROT1DEG_CD, self.shooting_fixed_angle, photo_cnt+1, None)
+            self.waiting_ack = True
+        elif self.driver.absolute_moves:
+            # the whole step in one command
+            print(f"rotate the plate by {pulses_left} degree(s).")
+            self.driver.rotate(pulses_left)
+            self.tracker.pulses_sent(pulses_left)
+            move_time = self.driver.move_time(pulses_left)
+            self.step_due = time.time() + move_time
+            self.schedule(move_time, self.shooting_fixed_angle, photo_cnt, 0)
+        else:
+            print("rotate the plate by 1 degree.")
+            self.driver.rotate(1)
+            self.tracker.pulses_sent(1)
+            move_time = self.driver.move_time(1)
+            self.step_due = time.time() + move_time
+            self.schedule(move_time, self.shooting_fixed_angle, photo_cnt, pulses_left-1)
+
+    def shooting_fixed_time_interval(self, photo_cnt, state):
+        if self.camera_state == "idle":
+            print("stop shooting_fixed_time_interval")
+            return 
+        if state == "end":
+            self.finish_shooting()
+            return
+        if photo_cnt >= self.num_of_photos:
+            self.stop_spinning()
+            return
+        print("a photo has been shot.")
+        self.should_take_photo = "true"
+        # without a sensor or speed control the angle is unknown
+        angle = self.tracker.reader.read()
+        if angle is None and self.driver.speed_control:
+            angle = photo_cnt * self.step_angle()
+        elif angle is None and self.calibration is not None:
+            angle = photo_cnt * self.time_interval * self.calibration.speed
+        self.shot_log.add_shot(photo_cnt, float("nan") if angle is None else angle,
+                               self.fixed_time_start + photo_cnt * self.time_interval)
+        self.photo_index = photo_cnt + 1
+        self.publish_status("shot")
+        print(f"{time.time() - self.fixed_time_start:.3f}s after starting shooting_time_interval.")
+        if photo_cnt + 1 >= self.num_of_photos:
+            # the last shot, let the turntable spin down while it is taken
+            self.stop_spinning()
+            return
+        self.schedule(self.time_interval, self.shooting_fixed_time_interval, photo_cnt+1, "normal")
+
+    def stop_spinning(self):
+        print("stop rotating...")
+        self.driver.stop()
+        self.spinning = False
+        self.schedule(self.driver.spin_down_time, self.shooting_fixed_time_interval, self.photo_index, "end")
+
+    def continuous_speed(self):
+        # a turntable with speed control covers exactly the angle (step) per
+        # interval
+        if self.driver.speed_control:
+            return self.step_angle() / self.time_interval
+        return None
+
+    def finish_shooting(self):
+        # the next session is started before anyone sees the idle state, so
+        # a listener that enqueues on it cannot start one as well
+        with self.engine_lock:
+            self.camera_state = "idle"
+            print("camera state to idle")
+            self.completed_sessions += 1
+            if self.session_start is not None:
+                self.busy_time += time.time() - self.session_start
+            self.print_ir_stats()
+            self.start_next_session(follow_up=True)
+        self.publish_status("state")
+
+    def connect_timeout(self):
+        # the phone stayed away, give up on its session
+        with self.engine_lock:
+            if self.local_triggers:
+                # the photos are taken without it
+                return
+            if self.camera_state == "shooting":
+                self.cancel_shooting()
+            self.reset_characteristics()
+            self.start_next_session()
+        self.publish_status("state")
+
+    def waitingHandler(self):
+        counter_diff = WAITING_HANDLER_CD / 0.4 - 1
+        if (self.connectState == "connected" and self.connected - self.lastConnected < counter_diff):
+            print("waiting to reconnect...")
+            self.connectState = "waiting"
+            if not self.local_triggers:
+                self.connectTimeout_th.start()
+            self.pause()
+            self.publish_status("connection")
+        elif (self.connectState == "waiting" and self.connected - self.lastConnected >= counter_diff):
+            self.connectState = "connected"
+            self.connectTimeout_th.cancel()
+            self.connectTimeout_th = threading.Timer(10, self.connect_timeout)
+            self.resume()
+            self.publish_status("connection")
+        elif (self.connectState == "waiting" and not self.local_triggers
+              and self.connectTimeout_th.ident is None):
+            # the local trigger went away while the phone was gone
+            self.connectTimeout_th.start()
+        self.lastConnected = self.connected
+        self.waitingHandler_th = threading.Timer(WAITING_HANDLER_CD, self.waitingHandler)
+        self.waitingHandler_th.start()
+
+    def change_light_color(self):
+        if self.light_color == "green":
+            self.send_ir("KEY_2")
+            self.light_color = "red"
+        elif self.light_color == "red":
+            self.send_ir("KEY_1")
+            self.light_color = "green"
+
+    def notify_disconnection(self):
+        self.set_connected(-1)
+
+    def cancel_threads(self):
+        try:
+            if self.shooting_th is not None:
+                self.shooting_th.cancel()
+        except AttributeError:
+            pass
+        try:
+            if self.waitingHandler_th is not None:
+                self.waitingHandler_th.cancel()
+        except AttributeError:
+            pass
+        try:
+            if self.connectTimeout_th is not None:
+                self.connectTimeout_th.cancel()
+        except AttributeError:
+            pass
+
+    def will_app_close(self):
+        self.notify_disconnection()
+        self.cancel_threads()
+        self.driver.close()
+        if self.ir is not None:
+            self.ir.close()
@@ -0,0 +1,16 @@
+from os import system
+
+REMOTE = "pisel"
+
+
+class IrSender(object):
+    """
+    Sends the keys of a lircd remote through the irsend command line tool.
+    """
+    def __init__(self, remote=REMOTE):
+        self.remote = remote
+
+    def send_once(self, key, count=1):
+        if count > 1:
+            return system(f"irsend SEND_ONCE --count={count} {self.remote} {key}")
+        return system(f"irsend SEND_ONCE {self.remote} {key}")
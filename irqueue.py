@@ -0,0 +1,108 @@
+import heapq
+import itertools
+import threading
+import time
+
+# priorities, lower goes first
+PRIORITY_STOP = 0
+PRIORITY_NORMAL = 1
+STOP_KEYS = ("KEY_STOP",)
+# keys whose repeated sends can be merged into one send with a repeat count
+COALESCE_KEYS = ("KEY_1",)
+# used when the config has no gap, in us
+DEFAULT_GAP = 108000
+
+
+class IrQueue(object):
+    """
+    Single dispatch point for IR commands. Sends run one at a time on a
+    worker thread, at least gap apart so the receiver does not drop frames,
+    stop commands jump the queue and queued rotation pulses are merged into
+    one send with a repeat count.
+    """
+    def __init__(self, sender, gap=DEFAULT_GAP, keys=None):
+        self.sender = sender
+        self.gap = gap / 1e6
+        self.keys = keys
+        self.queue = []
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+        self.last_sent = 0
+        self.running = True
+
+        self.sent = 0
+        self.frames = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def send(self, key, count=1, priority=None):
+        if self.keys is not None and key not in self.keys:
+            print(f"IR key {key} is not in the remote, ignored.")
+            self.rejected += 1
+            return False
+        if priority is None:
+            priority = PRIORITY_STOP if key in STOP_KEYS else PRIORITY_NORMAL
+
+        with self.cond:
+            if key in COALESCE_KEYS:
+                for item in self.queue:
+                    if item[3] == key:
+                        item[4] += count
+                        self.coalesced += count
+                        return True
+            # [priority, order, enqueued at, key, count]
+            heapq.heappush(self.queue, [priority, next(self.counter),
+                                        time.monotonic(), key, count])
+            self.max_depth = max(self.max_depth, len(self.queue))
+            self.cond.notify()
+
+        return True
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                wait = self.last_sent + self.gap - time.monotonic()
+                if wait > 0:
+                    # a stop can still arrive and go first
+                    self.cond.wait(wait)
+                    continue
+                priority, order, enqueued, key, count = heapq.heappop(self.queue)
+
+            waited = time.monotonic() - enqueued
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self.sender.send_once(key, count)
+            self.sent += 1
+            self.frames += count
+            self.last_sent = time.monotonic()
+
+    def depth(self):
+        with self.cond:
+            return len(self.queue)
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "frames": self.frames,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "mean_wait": self.total_wait / self.sent if self.sent else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
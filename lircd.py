@@ -0,0 +1,187 @@
+import fcntl
+import os
+import stat
+import struct
+import time
+from array import array
+
+# ioctls from linux/lirc.h
+LIRC_SET_SEND_CARRIER = 0x40046913
+LIRC_SET_SEND_DUTY_CYCLE = 0x40046915
+# the kernel takes at most this many pulse/space values per write
+LIRC_MAX_VALUES = 512
+DEFAULT_GAP = 108000
+DEFAULT_FREQUENCY = 38000
+
+PAIRS = ("header", "one", "zero", "repeat")
+NUMBERS = ("bits", "pre_data_bits", "post_data_bits", "ptrail", "plead",
+           "gap", "frequency", "duty_cycle", "eps", "aeps")
+
+
+class Remote(object):
+    """
+    One remote of a lircd.conf file, with the pulse/space trains of its
+    keys built on first use.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.flags = []
+        self.bits = 0
+        self.pre_data_bits = 0
+        self.pre_data = 0
+        self.post_data_bits = 0
+        self.post_data = 0
+        self.header = None
+        self.one = (0, 0)
+        self.zero = (0, 0)
+        self.repeat = None
+        self.ptrail = 0
+        self.plead = 0
+        self.gap = DEFAULT_GAP
+        self.frequency = DEFAULT_FREQUENCY
+        self.duty_cycle = 0
+        self.eps = 0
+        self.aeps = 0
+        self.codes = {}
+        self.trains = {}
+
+    def keys(self):
+        return list(self.codes)
+
+    def bit_values(self, value, bits, out):
+        for i in range(bits - 1, -1, -1):
+            out.extend(self.one if (value >> i) & 1 else self.zero)
+
+    def frame(self, key):
+        """Pulse/space values of one full frame of key, ending on a pulse."""
+        values = array("I")
+        if self.header is not None:
+            values.extend(self.header)
+        if self.plead:
+            values.append(self.plead)
+        self.bit_values(self.pre_data, self.pre_data_bits, values)
+        self.bit_values(self.codes[key], self.bits, values)
+        self.bit_values(self.post_data, self.post_data_bits, values)
+        if self.ptrail:
+            values.append(self.ptrail)
+        return values
+
+    def repeat_frame(self, key):
+        if self.repeat is None:
+            return self.frame(key)
+        values = array("I", self.repeat)
+        if self.ptrail:
+            values.append(self.ptrail)
+        return values
+
+    def space_after(self, frame):
+        if "CONST_LENGTH" in self.flags:
+            return max(self.gap - sum(frame), 0)
+        return self.gap
+
+    def pulse_train(self, key, count=1):
+        """
+        Values for key sent count times, the first as a full frame and the
+        rest as repeat codes like irsend --count does. Split in chunks the
+        kernel accepts in one write; returns a list of (values, space) with
+        the space to wait after each chunk.
+        """
+        cache_key = (key, count)
+        if cache_key in self.trains:
+            return self.trains[cache_key]
+
+        frames = [self.frame(key)] + [self.repeat_frame(key)] * (count - 1)
+        chunks = []
+        values = array("I")
+        space = 0
+        for frame in frames:
+            if values and len(values) + 1 + len(frame) > LIRC_MAX_VALUES:
+                chunks.append((values, space))
+                values = array("I")
+            if values:
+                values.append(space)
+            values.extend(frame)
+            space = self.space_after(frame)
+        chunks.append((values, space))
+
+        self.trains[cache_key] = chunks
+        return chunks
+
+
+def parse_number(word):
+    return int(word, 0)
+
+
+def parse(path):
+    """Return the remotes of a lircd.conf file, by name."""
+    remotes = {}
+    remote = None
+    in_codes = False
+    with open(path) as f:
+        for line in f:
+            words = line.split("#", 1)[0].split()
+            if not words:
+                continue
+            if words == ["begin", "remote"]:
+                remote = Remote(None)
+            elif words == ["end", "remote"]:
+                remotes[remote.name] = remote
+                remote = None
+            elif remote is None:
+                continue
+            elif words == ["begin", "codes"]:
+                in_codes = True
+            elif words == ["end", "codes"]:
+                in_codes = False
+            elif in_codes:
+                remote.codes[words[0]] = parse_number(words[1])
+            elif words[0] == "name":
+                remote.name = words[1]
+            elif words[0] == "flags":
+                remote.flags = words[1].split("|")
+            elif words[0] in PAIRS:
+                setattr(remote, words[0], (int(words[1]), int(words[2])))
+            elif words[0] in NUMBERS:
+                setattr(remote, words[0], int(words[1]))
+            elif words[0] in ("pre_data", "post_data"):
+                setattr(remote, words[0], parse_number(words[1]))
+    return remotes
+
+
+class LircDevice(object):
+    """
+    Sends the keys of a remote by writing their pulse trains straight to a
+    /dev/lirc* transmitter, without lircd. The device has to exist and be a
+    character device; with allow_file an existing plain file receives the
+    raw values instead, for tests.
+    """
+    def __init__(self, remote, path="/dev/lirc0", allow_file=False):
+        self.remote = remote
+        self.path = path
+        self.fd = os.open(path, os.O_WRONLY)
+        is_device = stat.S_ISCHR(os.fstat(self.fd).st_mode)
+        if not is_device and not allow_file:
+            os.close(self.fd)
+            raise ValueError(f"{path} is not a character device")
+        for key in remote.keys():
+            remote.pulse_train(key)
+        if is_device:
+            fcntl.ioctl(self.fd, LIRC_SET_SEND_CARRIER,
+                        struct.pack("I", remote.frequency))
+            if remote.duty_cycle:
+                fcntl.ioctl(self.fd, LIRC_SET_SEND_DUTY_CYCLE,
+                            struct.pack("I", remote.duty_cycle))
+
+    def send_once(self, key, count=1):
+        if key not in self.remote.codes:
+            print(f"IR key {key} is not in the remote, ignored.")
+            return False
+        chunks = self.remote.pulse_train(key, count)
+        for i, (values, space) in enumerate(chunks):
+            os.write(self.fd, values.tobytes())
+            if i < len(chunks) - 1:
+                time.sleep(space / 1e6)
+        return True
+
+    def close(self):
+        os.close(self.fd)
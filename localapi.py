@@ -0,0 +1,217 @@
+"""Control the capture from scripts on the Pi, without a phone.
+
+Clients talk JSON lines over a Unix socket. Each request is an object with
+a "cmd" key and gets one reply object with "ok" set:
+
+    {"cmd": "status"}
+    {"cmd": "set", "mode": "fixed_angle", "num_of_photos": 24, "angle": 15}
+    {"cmd": "start"} / {"cmd": "stop"}
+    {"cmd": "enqueue", "jobs": [{"mode": "fixed_angle", "num_of_photos": 24, "angle": 15}, ...]}
+                            a job may add "countdown" and "return_to_zero"
+    {"cmd": "clear"}        drop the queued jobs
+    {"cmd": "ack"}          the shutter fired, like the phone writing "false"
+    {"cmd": "trigger", "local": true}   this client acks the shots, do not
+                                        pause when the phone goes away (until
+                                        it disconnects)
+    {"cmd": "subscribe"}    then one line per status event until disconnect
+"""
+
+import json
+import os
+import queue
+import socket
+import socketserver
+import subprocess
+import threading
+
+API_SOCKET = "/tmp/rpicontrol.sock"
+
+
+class ApiHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        # whether this connection registered a local trigger
+        self.trigger = False
+
+    def finish(self):
+        if self.trigger:
+            self.server.api.service.remove_local_trigger()
+            self.trigger = False
+        super().finish()
+
+    def reply(self, obj):
+        self.wfile.write((json.dumps(obj) + "\n").encode())
+        self.wfile.flush()
+
+    def handle(self):
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+                cmd = request.pop("cmd")
+            except (ValueError, KeyError, AttributeError):
+                self.reply({"ok": False, "error": "expected a JSON object with a 'cmd'"})
+                continue
+            if cmd == "subscribe":
+                self.subscribe()
+                return
+            try:
+                result = self.server.api.dispatch(cmd, request, self)
+            except (ValueError, TypeError, KeyError) as e:
+                self.reply({"ok": False, "error": str(e)})
+                continue
+            self.reply(dict(ok=True, **result))
+
+    def subscribe(self):
+        events = self.server.api.subscribe()
+        try:
+            self.reply({"ok": True})
+            while True:
+                self.reply(events.get())
+        except OSError:
+            pass
+        finally:
+            self.server.api.unsubscribe(events)
+
+
+class ApiServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class LocalApi(object):
+    """
+    Serves the local control socket on top of the CameraService methods the
+    GATT characteristics use.
+    """
+    def __init__(self, service, path=API_SOCKET):
+        self.service = service
+        self.path = path
+        self.subscribers = []
+        self.lock = threading.Lock()
+        service.add_status_listener(self.status_changed)
+
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = ApiServer(path, ApiHandler)
+        self.server.api = self
+        os.chmod(path, 0o660)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        print(f"local control API on {path}")
+
+    def dispatch(self, cmd, args, client=None):
+        service = self.service
+        if cmd == "status":
+            return self.status()
+        if cmd == "set":
+            service.apply_session(args)
+            return {}
+        if cmd == "start":
+            if service.get_camera_state() != "idle":
+                raise ValueError(f"camera is {service.get_camera_state()}")
+            service.set_camera_state("shooting")
+            return {}
+        if cmd == "stop":
+            if service.get_camera_state() == "calibrating":
+                raise ValueError("cannot stop a calibration")
+            service.set_camera_state("idle")
+            return {}
+        if cmd == "enqueue":
+            jobs = args.get("jobs")
+            if not isinstance(jobs, list):
+                raise ValueError("'jobs' should be a list of session settings")
+            service.enqueue_sessions(jobs)
+            return {"queued": service.queued_sessions()}
+        if cmd == "clear":
+            service.clear_sessions()
+            return {}
+        if cmd == "ack":
+            service.set_should_take_photo("false")
+            return {}
+        if cmd == "trigger":
+            if client is None:
+                raise ValueError("'trigger' needs a connection")
+            local = bool(args.get("local", True))
+            if local and not client.trigger:
+                service.add_local_trigger()
+            elif not local and client.trigger:
+                service.remove_local_trigger()
+            client.trigger = local
+            return {}
+        raise ValueError(f"unknown command '{cmd}'")
+
+    def status(self):
+        service = self.service
+        return {"state": service.get_status(), "mode": service.mode,
+                "num_of_photos": service.num_of_photos,
+                "time_interval": service.time_interval,
+                "angle": service.angle, "photo_index": service.photo_index,
+                "sessions": service.session_stats()}
+
+    def subscribe(self):
+        events = queue.Queue()
+        with self.lock:
+            self.subscribers.append(events)
+        return events
+
+    def unsubscribe(self, events):
+        with self.lock:
+            self.subscribers.remove(events)
+
+    def status_changed(self, service, event):
+        message = dict(event=event, **self.status())
+        with self.lock:
+            for events in self.subscribers:
+                events.put(message)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class ShutterTrigger(object):
+    """
+    Fires a local or tethered camera with a shell command on every shot and
+    acknowledges the shot once the command returns, in place of the phone.
+    """
+    def __init__(self, service, command):
+        self.service = service
+        self.command = command
+        service.add_status_listener(self.status_changed)
+        service.add_local_trigger()
+
+    def status_changed(self, service, event):
+        if event == "shot":
+            threading.Thread(target=self.fire).start()
+
+    def fire(self):
+        result = subprocess.run(self.command, shell=True)
+        if result.returncode != 0:
+            print(f"trigger command failed with {result.returncode}")
+        self.service.set_should_take_photo("false")
+
+
+class LocalApiClient(object):
+    def __init__(self, path=API_SOCKET):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.file = self.sock.makefile("rw")
+
+    def request(self, cmd, **args):
+        self.file.write(json.dumps(dict(cmd=cmd, **args)) + "\n")
+        self.file.flush()
+        return json.loads(self.file.readline())
+
+    def events(self):
+        """Subscribe and yield status events; the connection is used up."""
+        self.request("subscribe")
+        for line in self.file:
+            yield json.loads(line)
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
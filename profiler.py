@@ -0,0 +1,167 @@
+import collections
+import functools
+import sys
+import threading
+import time
+import traceback
+try:
+  from gi.repository import GObject
+except ImportError:
+    import gobject as GObject
+
+PROFILE_FILE = "/tmp/rpicontrol.folded"
+# stack sampling period, in s
+SAMPLE_INTERVAL = 0.01
+# steps starting later than this after their due time are reported, in s
+LATE_THRESHOLD = 0.05
+# the mainloop is stalled when its heartbeat is older than this, in s
+STALL_THRESHOLD = 0.2
+# in ms
+HEARTBEAT_INTERVAL = 50
+
+
+class Timing(object):
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+
+class Profiler(object):
+    """
+    Opt-in diagnostics for capture hiccups: samples the stacks of every
+    thread into flamegraph-compatible collapsed stacks, times instrumented
+    calls, reports steps that start late and mainloop stalls.
+    """
+    def __init__(self, path=PROFILE_FILE, interval=SAMPLE_INTERVAL,
+                 late_threshold=LATE_THRESHOLD, stall_threshold=STALL_THRESHOLD):
+        self.path = path
+        self.interval = interval
+        self.late_threshold = late_threshold
+        self.stall_threshold = stall_threshold
+        self.stacks = collections.Counter()
+        self.timings = collections.defaultdict(Timing)
+        self.late_steps = 0
+        self.stalls = 0
+        self.lock = threading.Lock()
+        self.running = True
+        # no stall checks until the mainloop beats for the first time
+        self.heartbeat = None
+        self.main_thread = threading.main_thread().ident
+        self.sampler = threading.Thread(target=self.sample_loop, daemon=True)
+        self.sampler.start()
+
+    def start_watchdog(self):
+        """The mainloop beats every HEARTBEAT_INTERVAL ms while it is responsive."""
+        GObject.timeout_add(HEARTBEAT_INTERVAL, self.beat)
+
+    def beat(self):
+        self.heartbeat = time.monotonic()
+        return self.running
+
+    def sample_loop(self):
+        stalled = False
+        while self.running:
+            self.sample()
+            if self.heartbeat is None:
+                time.sleep(self.interval)
+                continue
+            age = time.monotonic() - self.heartbeat
+            if age > self.stall_threshold and not stalled:
+                stalled = True
+                self.stalls += 1
+                frame = sys._current_frames().get(self.main_thread)
+                where = "".join(traceback.format_stack(frame, limit=4)) if frame else ""
+                print(f"mainloop stalled for {age:.3f}s in:\n{where}")
+            elif age <= self.stall_threshold:
+                stalled = False
+            time.sleep(self.interval)
+
+    def sample(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        me = threading.get_ident()
+        with self.lock:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def record(self, name, elapsed):
+        with self.lock:
+            self.timings[name].add(elapsed)
+
+    def wrap(self, name, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return timed
+
+    def instrument_class(self, cls, names):
+        """
+        Time the methods of cls. dbus-python looks exported methods up on the
+        class, so they have to be wrapped there; functools.wraps keeps the
+        export markers. Only methods the class defines itself are wrapped.
+        """
+        for name in names:
+            func = cls.__dict__.get(name)
+            if func is not None and not getattr(func, "_profiled", False):
+                wrapped = self.wrap(f"{cls.__name__}.{name}", func)
+                wrapped._profiled = True
+                setattr(cls, name, wrapped)
+
+    def instrument_object(self, obj, names):
+        for name in names:
+            setattr(obj, name, self.wrap(f"{type(obj).__name__}.{name}", getattr(obj, name)))
+
+    def run_step(self, step, args, due):
+        late = time.monotonic() - due
+        name = getattr(step, "__name__", repr(step))
+        if late > self.late_threshold:
+            self.late_steps += 1
+            print(f"{name} started {late * 1000:.0f} ms late")
+        start = time.perf_counter()
+        try:
+            step(*args)
+        finally:
+            self.record(f"step.{name}", time.perf_counter() - start)
+            self.record("step.lateness", max(late, 0.0))
+
+    def request_dump(self):
+        """
+        Dump from a thread of its own: safe from a signal handler, which may
+        interrupt the main thread while it holds the lock in record().
+        """
+        threading.Thread(target=self.dump, daemon=True).start()
+
+    def dump(self, path=None):
+        path = path or self.path
+        with self.lock:
+            stacks = list(self.stacks.items())
+            timings = sorted(self.timings.items())
+        with open(path, "w") as f:
+            for stack, count in stacks:
+                f.write(f"{stack} {count}\n")
+        print(f"profile: {len(stacks)} stacks written to {path}, "
+              f"{self.late_steps} late steps, {self.stalls} mainloop stalls")
+        for name, t in timings:
+            print(f"  {name}: {t.count} calls, {t.total / t.count * 1000:.2f} ms mean, "
+                  f"{t.max * 1000:.2f} ms max")
+        return path
+
+    def stop(self):
+        self.running = False
@@ -19,6 +19,7 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import socket
 import dbus
 import dbus.mainloop.glib
 import dbus.exceptions
@@ -54,6 +55,7 @@ class Application(dbus.service.Object):
         self.path = "/"
         self.services = []
         self.next_index = 0
+        self.registered_callback = None
         dbus.service.Object.__init__(self, self.bus, self.path)
 
     def get_path(self):
@@ -79,12 +81,16 @@ class Application(dbus.service.Object):
 
     def register_app_callback(self):
         print("GATT application registered")
+        if self.registered_callback is not None:
+            self.registered_callback()
 
     def register_app_error_callback(self, error):
         print("Failed to register application: " + str(error))
 
-    def register(self):
-        adapter = BleTools.find_adapter(self.bus)
+    def register(self, adapter=None, callback=None):
+        if adapter is None:
+            adapter = BleTools.find_adapter(self.bus)
+        self.registered_callback = callback
 
         service_manager = dbus.Interface(
                 self.bus.get_object(BLUEZ_SERVICE_NAME, adapter),
@@ -160,8 +166,13 @@ class Service(dbus.service.Object):
 class Characteristic(dbus.service.Object):
     """
     org.bluez.GattCharacteristic1 interface implementation
+
+    Pass acquire_notify / acquire_write to let BlueZ hand over a socket for
+    notifications / write-without-response instead of going through
+    PropertiesChanged signals and WriteValue calls.
     """
-    def __init__(self, uuid, flags, service):
+    def __init__(self, uuid, flags, service,
+                 acquire_notify=False, acquire_write=False):
         index = service.get_next_index()
         self.path = service.path + '/char' + str(index)
         self.bus = service.get_bus()
@@ -170,19 +181,35 @@ class Characteristic(dbus.service.Object):
         self.flags = flags
         self.descriptors = []
         self.next_index = 0
+        self.acquire_notify = acquire_notify
+        self.acquire_write = acquire_write
+        self.notify_sock = None
+        self.notify_mtu = 0
+        self.notify_watch = None
+        self.write_sock = None
+        self.write_mtu = 0
+        if acquire_write and "write-without-response" not in self.flags:
+            self.flags = self.flags + ["write-without-response"]
         dbus.service.Object.__init__(self, self.bus, self.path)
 
     def get_properties(self):
-        return {
-                GATT_CHRC_IFACE: {
-                        'Service': self.service.get_path(),
-                        'UUID': self.uuid,
-                        'Flags': self.flags,
-                        'Descriptors': dbus.Array(
-                                self.get_descriptor_paths(),
-                                signature='o')
-                }
+        properties = {
+                'Service': self.service.get_path(),
+                'UUID': self.uuid,
+                'Flags': self.flags,
+                'Descriptors': dbus.Array(
+                        self.get_descriptor_paths(),
+                        signature='o')
         }
+        # BlueZ only calls AcquireNotify/AcquireWrite when these are present
+        if self.acquire_notify:
+            properties['NotifyAcquired'] = dbus.Boolean(
+                    self.notify_sock is not None)
+        if self.acquire_write:
+            properties['WriteAcquired'] = dbus.Boolean(
+                    self.write_sock is not None)
+
+        return {GATT_CHRC_IFACE: properties}
 
     def get_path(self):
         return dbus.ObjectPath(self.path)
@@ -230,6 +257,117 @@ class Characteristic(dbus.service.Object):
         print('Default StopNotify called, returning error')
         raise NotSupportedException()
 
+    @dbus.service.method(GATT_CHRC_IFACE,
+                         in_signature='a{sv}',
+                         out_signature='hq')
+    def AcquireNotify(self, options):
+        if not self.acquire_notify:
+            raise NotSupportedException()
+        if self.notify_sock is not None:
+            raise NotPermittedException()
+
+        mtu = int(options.get('mtu', 23))
+        local, remote = self.new_socket_pair()
+        self.notify_sock = local
+        self.notify_mtu = mtu
+        self.notify_watch = GObject.io_add_watch(local.fileno(),
+                             GObject.IO_HUP | GObject.IO_ERR,
+                             self.notify_sock_closed)
+        print("notify socket acquired (mtu %d)" % mtu)
+        self.notify_acquired()
+
+        return (self.hand_over(remote), dbus.UInt16(mtu))
+
+    @dbus.service.method(GATT_CHRC_IFACE,
+                         in_signature='a{sv}',
+                         out_signature='hq')
+    def AcquireWrite(self, options):
+        if not self.acquire_write:
+            raise NotSupportedException()
+        if self.write_sock is not None:
+            raise NotPermittedException()
+
+        mtu = int(options.get('mtu', 23))
+        local, remote = self.new_socket_pair()
+        self.write_sock = local
+        self.write_mtu = mtu
+        GObject.io_add_watch(local.fileno(),
+                             GObject.IO_IN | GObject.IO_HUP | GObject.IO_ERR,
+                             self.write_sock_ready)
+        print("write socket acquired (mtu %d)" % mtu)
+
+        return (self.hand_over(remote), dbus.UInt16(mtu))
+
+    def new_socket_pair(self):
+        local, remote = socket.socketpair(socket.AF_UNIX,
+                                          socket.SOCK_SEQPACKET)
+        local.setblocking(False)
+
+        return local, remote
+
+    def hand_over(self, remote):
+        # UnixFd dups the descriptor; ours has to be closed, or the local end
+        # never sees the hang-up when bluetoothd closes its copy
+        fd = dbus.types.UnixFd(remote.fileno())
+        remote.close()
+
+        return fd
+
+    def notify_acquired(self):
+        pass
+
+    def notify_sock_closed(self, fd, condition):
+        # the watch goes away with the False return
+        self.notify_watch = None
+        self.close_notify_sock()
+
+        return False
+
+    def close_notify_sock(self):
+        # the watch has to go with the socket, a reused fd would trigger it
+        if self.notify_watch is not None:
+            GObject.source_remove(self.notify_watch)
+            self.notify_watch = None
+        if self.notify_sock is not None:
+            print("notify socket released")
+            self.notify_sock.close()
+            self.notify_sock = None
+
+    def write_sock_ready(self, fd, condition):
+        if condition & GObject.IO_IN:
+            try:
+                data = self.write_sock.recv(max(self.write_mtu, 512))
+            except BlockingIOError:
+                return True
+            except OSError:
+                data = b''
+            if data:
+                self.WriteValue([dbus.Byte(b) for b in data], {})
+                return True
+
+        print("write socket released")
+        self.write_sock.close()
+        self.write_sock = None
+
+        return False
+
+    def send_notify(self, value):
+        """
+        Send a notification with value (a list of bytes), over the acquired
+        socket when there is one and through PropertiesChanged otherwise.
+        """
+        if self.notify_sock is not None:
+            try:
+                self.notify_sock.send(bytes(value))
+                return
+            except BlockingIOError:
+                # notifications are lossy, the next tick sends a fresh value
+                return
+            except OSError:
+                self.close_notify_sock()
+
+        self.PropertiesChanged(GATT_CHRC_IFACE, {"Value": value}, [])
+
     @dbus.service.signal(DBUS_PROP_IFACE,
                          signature='sa{sv}as')
     def PropertiesChanged(self, interface, changed, invalidated):
@@ -0,0 +1,81 @@
+import struct
+import time
+from array import array
+
+# header: number of shots, session start (unix time)
+HEADER = struct.Struct("<Hd")
+# page header: the header and the position of the first record of the page
+PAGE_HEADER = struct.Struct("<HdH")
+# shot: index, cumulative angle (deg), angle error (deg), scheduled / actual /
+# phone ack time in ms after the session start (NO_ACK when the phone never
+# answered)
+RECORD = struct.Struct("<HffIII")
+NO_ACK = 0xFFFFFFFF
+
+
+class ShotLog(object):
+    """
+    In-memory log of the shots of the current session, one array per column.
+    """
+    def __init__(self):
+        self.start_time = time.time()
+        self.clear()
+
+    def clear(self):
+        self.index = array("H")
+        self.angle = array("f")
+        self.error = array("f")
+        self.scheduled = array("d")
+        self.actual = array("d")
+        self.ack = array("d")
+
+    def start(self):
+        self.clear()
+        self.start_time = time.time()
+
+    def __len__(self):
+        return len(self.index)
+
+    def add_shot(self, index, angle, scheduled, actual=None, error=float("nan")):
+        if actual is None:
+            actual = time.time()
+        self.index.append(index)
+        self.angle.append(angle)
+        self.error.append(error)
+        self.scheduled.append(scheduled)
+        self.actual.append(actual)
+        self.ack.append(0.0)
+
+    def ack_last(self, ack_time=None):
+        if not self.ack or self.ack[-1]:
+            return
+        if ack_time is None:
+            ack_time = time.time()
+        self.ack[-1] = ack_time
+
+    def to_ms(self, t):
+        return max(0, int(round((t - self.start_time) * 1000)))
+
+    def encode_record(self, i):
+        ack = self.to_ms(self.ack[i]) if self.ack[i] else NO_ACK
+        return RECORD.pack(self.index[i], self.angle[i], self.error[i],
+                           self.to_ms(self.scheduled[i]), self.to_ms(self.actual[i]), ack)
+
+    def encode(self):
+        data = bytearray(HEADER.pack(len(self.index), self.start_time))
+        for i in range(len(self.index)):
+            data += self.encode_record(i)
+        return bytes(data)
+
+    def read_page(self, first, size):
+        """
+        The records from position first on that fit in size bytes behind a
+        page header, at least one while any are left.
+        """
+        count = len(self.index)
+        first = min(max(first, 0), count)
+        data = bytearray(PAGE_HEADER.pack(count, self.start_time, first))
+        fit = max((size - PAGE_HEADER.size) // RECORD.size, 1)
+        for i in range(first, min(first + fit, count)):
+            data += self.encode_record(i)
+        return bytes(data)
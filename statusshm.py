@@ -0,0 +1,228 @@
+"""Live controller status for processes on the same Pi.
+
+The controller writes a status block and a ring of events to a file in
+/dev/shm that readers map into memory. The status block is guarded by a
+sequence counter (seqlock): the writer makes it odd while writing and even
+again when done, readers retry until they see the same even value before
+and after copying the block. Ring entries carry their event number, so a
+reader can tell an entry that was overwritten while it was read.
+
+The writer builds the block in a new file and renames it into place, so a
+reader never sees a truncated file. Each controller start bumps the
+generation in the header; readers notice the new file and map it.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+SHM_PATH = "/dev/shm/rpicontrol-status"
+MAGIC = b"RPIC"
+VERSION = 2
+RING_SIZE = 256
+# how often a reader looks for a restarted writer, in s
+RESTART_CHECK = 0.1
+
+# magic, version, seqlock counter, ring size, events written, generation
+HEADER = struct.Struct("<4sIIIQQ")
+# state, photo index, total photos, angle, last shutter, updated (unix time)
+STATUS = struct.Struct("<B3xIIddd")
+# event number, time, type, photo index, angle
+EVENT = struct.Struct("<QdB3xId")
+
+STATUS_OFFSET = HEADER.size
+RING_OFFSET = STATUS_OFFSET + STATUS.size
+
+STATES = ("idle", "countdown", "shooting", "paused", "calibrating")
+EVENTS = ("state", "shot", "connection")
+
+
+def code(names, name):
+    return names.index(name) if name in names else 0xFF
+
+
+def name(names, code):
+    return names[code] if code < len(names) else "unknown"
+
+
+def read_generation(path):
+    """Generation of the status block at path, 0 when there is none."""
+    try:
+        with open(path, "rb") as f:
+            magic, version, _, _, _, generation = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return 0
+    return generation if magic == MAGIC and version == VERSION else 0
+
+
+class StatusWriter(object):
+    def __init__(self, path=SHM_PATH, ring_size=RING_SIZE):
+        self.path = path
+        self.ring_size = ring_size
+        size = RING_OFFSET + ring_size * EVENT.size
+        self.generation = read_generation(path) + 1
+        # readers may still map the old file, it must not shrink under them
+        tmp = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.seq = 0
+        self.events = 0
+        self.last_shutter = 0.0
+        self.lock = threading.Lock()
+        self.write_header()
+        os.rename(tmp, path)
+
+    def write_header(self):
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, self.seq,
+                         self.ring_size, self.events, self.generation)
+
+    def set_seq(self, seq):
+        self.seq = seq
+        struct.pack_into("<I", self.map, 8, seq)
+
+    def write_status(self, state, photo_index, total, angle):
+        self.set_seq(self.seq + 1)
+        STATUS.pack_into(self.map, STATUS_OFFSET, code(STATES, state),
+                         photo_index, total, angle, self.last_shutter,
+                         time.time())
+        self.set_seq(self.seq + 1)
+
+    def add_event(self, event, photo_index, angle):
+        now = time.time()
+        if event == "shot":
+            self.last_shutter = now
+        slot = self.events % self.ring_size
+        EVENT.pack_into(self.map, RING_OFFSET + slot * EVENT.size,
+                        self.events, now, code(EVENTS, event),
+                        photo_index, angle)
+        # publish the entry only once it is complete
+        self.events += 1
+        struct.pack_into("<Q", self.map, 16, self.events)
+
+    def status_changed(self, service, event):
+        # the service publishes from its timer threads and the mainloop
+        angle = service.tracker.measured()
+        with self.lock:
+            self.add_event(event, service.photo_index, angle)
+            self.write_status(service.get_status(), service.photo_index,
+                              service.num_of_photos, angle)
+
+    def close(self):
+        self.map.close()
+
+
+class StatusReader(object):
+    """
+    Follows the status written by StatusWriter:
+
+        reader = StatusReader()
+        print(reader.status())
+        for event in reader.new_events():
+            print(event)
+    """
+    def __init__(self, path=SHM_PATH):
+        self.path = path
+        self.map = None
+        self.open()
+        # only events written from now on
+        self.next_event = self.events_written()
+
+    def open(self):
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            st = os.fstat(fd)
+            new_map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        magic, version, seq, ring_size, events, generation = HEADER.unpack_from(new_map, 0)
+        if magic != MAGIC or version != VERSION:
+            new_map.close()
+            raise ValueError(f"{self.path} is not a controller status block")
+        if self.map is not None:
+            self.map.close()
+        self.map = new_map
+        self.inode = (st.st_dev, st.st_ino)
+        self.ring_size = ring_size
+        self.generation = generation
+        self.last_check = time.monotonic()
+
+    def follow(self):
+        """
+        Map the block of a restarted controller. Returns True when the
+        generation changed, its events are then read from the start.
+        """
+        if time.monotonic() - self.last_check < RESTART_CHECK:
+            return False
+        self.last_check = time.monotonic()
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        if (st.st_dev, st.st_ino) == self.inode:
+            return False
+        generation = self.generation
+        try:
+            self.open()
+        except (OSError, ValueError):
+            return False
+        if self.generation == generation:
+            return False
+        self.next_event = 0
+        return True
+
+    def seq(self):
+        return struct.unpack_from("<I", self.map, 8)[0]
+
+    def status(self):
+        self.follow()
+        while True:
+            before = self.seq()
+            if before & 1:
+                continue
+            data = STATUS.unpack_from(self.map, STATUS_OFFSET)
+            if self.seq() == before:
+                break
+        state, photo_index, total, angle, last_shutter, updated = data
+        return {"state": name(STATES, state), "photo_index": photo_index,
+                "total": total, "angle": angle, "last_shutter": last_shutter,
+                "updated": updated}
+
+    def events_written(self):
+        return struct.unpack_from("<Q", self.map, 16)[0]
+
+    def new_events(self):
+        """Events since the last call; lost ones are skipped if the reader fell a ring behind."""
+        self.follow()
+        written = self.events_written()
+        if written - self.next_event > self.ring_size:
+            self.next_event = written - self.ring_size
+        result = []
+        while self.next_event < written:
+            slot = self.next_event % self.ring_size
+            offset = RING_OFFSET + slot * EVENT.size
+            number, t, event, photo_index, angle = EVENT.unpack_from(self.map, offset)
+            # the writer may have lapped us while we copied the entry
+            again = struct.unpack_from("<Q", self.map, offset)[0]
+            if number == self.next_event and again == number:
+                result.append({"time": t, "event": name(EVENTS, event),
+                               "photo_index": photo_index, "angle": angle})
+            self.next_event += 1
+        return result
+
+    def wait_event(self, timeout=None, poll=0.0005):
+        """Block until an event arrives (busy polling with a short sleep)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.events_written() == self.next_event and not self.follow():
+            if deadline is not None and time.monotonic() > deadline:
+                return []
+            time.sleep(poll)
+        return self.new_events()
+
+    def close(self):
+        self.map.close()
@@ -0,0 +1,42 @@
+from angle import AngleTracker, FilePositionReader
+
+
+def write(path, angle):
+    with open(path, "a") as f:
+        f.write(f"{angle}\n")
+
+
+def test_file_reader(tmp_path):
+    path = str(tmp_path / "angle")
+    reader = FilePositionReader(path)
+    assert reader.read() is None
+    write(path, 10.0)
+    reader.zero()
+    write(path, 12.5)
+    assert reader.read() == 2.5
+
+
+def test_open_loop():
+    tracker = AngleTracker()
+    assert not tracker.has_feedback()
+    assert tracker.plan_step(3) == 3
+    tracker.pulses_sent(3)
+    assert tracker.measured() == 3
+    assert tracker.error() == 0
+
+
+def test_lost_pulses_are_made_up(tmp_path):
+    path = str(tmp_path / "angle")
+    write(path, 0)
+    tracker = AngleTracker(FilePositionReader(path))
+    assert tracker.plan_step(5) == 5
+    tracker.pulses_sent(5)
+    # two frames got lost
+    write(path, 3)
+    assert tracker.error() == -2
+    assert tracker.plan_step(5) == 7
+    # overshoot within tolerance is left alone, beyond it the step shrinks
+    write(path, 10.3)
+    assert tracker.plan_step(0) == 0
+    write(path, 12)
+    assert tracker.plan_step(5) == 3
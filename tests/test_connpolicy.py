@@ -0,0 +1,111 @@
+import struct
+import time
+
+import connpolicy
+from connpolicy import ConnectionPolicy, HciEventMonitor, LOW_LATENCY, RELAXED
+
+PHONE = "AA:BB:CC:DD:EE:FF"
+ADAPTER = "/org/bluez/hci0"
+
+
+class ObjectManager(object):
+    """Stands in for org.freedesktop.DBus.ObjectManager of BlueZ."""
+    def __init__(self):
+        self.connected = {PHONE: True}
+
+    def GetManagedObjects(self):
+        objects = {ADAPTER: {"org.bluez.Adapter1": {}}}
+        for address, connected in self.connected.items():
+            path = ADAPTER + "/dev_" + address.replace(":", "_")
+            objects[path] = {connpolicy.DEVICE_IFACE: {"Address": address,
+                                                        "Connected": connected}}
+        return objects
+
+
+class Updater(object):
+    def __init__(self):
+        self.requests = []
+
+    def handles(self):
+        return {PHONE: 64}
+
+    def request(self, handle, params):
+        self.requests.append((handle, params))
+        return True
+
+
+class Service(object):
+    status = "idle"
+
+    def get_status(self):
+        return self.status
+
+
+def settle(policy):
+    deadline = time.monotonic() + 2.0
+    while not policy.requests.empty() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+
+
+def make_policy():
+    updater = Updater()
+    policy = ConnectionPolicy(adapter=ADAPTER, manager=ObjectManager(),
+                              updater=updater, monitor=None)
+    return policy, updater
+
+
+def test_follows_the_shooting_phase():
+    policy, updater = make_policy()
+    service = Service()
+    service.status = "countdown"
+    policy.status_changed(service, "state")
+    settle(policy)
+    service.status = "shooting"
+    policy.status_changed(service, "state")
+    settle(policy)
+    service.status = "idle"
+    policy.status_changed(service, "state")
+    settle(policy)
+    policy.close()
+    assert updater.requests == [(64, LOW_LATENCY), (64, RELAXED)]
+    assert policy.stats()[PHONE]["requested"] == RELAXED
+
+
+def test_records_negotiated_values():
+    policy, updater = make_policy()
+    service = Service()
+    service.status = "shooting"
+    policy.status_changed(service, "state")
+    settle(policy)
+    policy.negotiated(64, 9, 0, 500)
+    policy.close()
+    device = policy.stats()[PHONE]
+    assert device["phase"] == "shooting"
+    assert device["negotiated"] == (9, 0, 500)
+
+
+def test_ignores_other_events_and_disconnected_devices():
+    policy, updater = make_policy()
+    policy.manager.connected[PHONE] = False
+    service = Service()
+    service.status = "shooting"
+    policy.status_changed(service, "shot")
+    policy.status_changed(service, "state")
+    settle(policy)
+    policy.close()
+    assert updater.requests == []
+
+
+def test_hci_events():
+    events = []
+    monitor = HciEventMonitor.__new__(HciEventMonitor)
+    monitor.callback = lambda *args: events.append(args)
+    # LE connection update complete: status, handle, interval, latency, timeout
+    monitor.parse(bytes([0x04, 0x3E, 10, 0x03]) + struct.pack("<BHHHH", 0, 64, 12, 0, 500))
+    # LE connection complete, the peer address is little endian
+    monitor.parse(bytes([0x04, 0x3E, 19, 0x01]) + struct.pack("<BHBB", 0, 65, 1, 1)
+                  + bytes([0xFF, 0xEE, 0xDD, 0xCC, 0xBB, 0xAA]) + struct.pack("<HHHB", 24, 0, 500, 0))
+    # failed update
+    monitor.parse(bytes([0x04, 0x3E, 10, 0x03]) + struct.pack("<BHHHH", 0x3B, 64, 12, 0, 500))
+    assert events == [(64, 12, 0, 500, None), (65, 24, 0, 500, PHONE)]
@@ -0,0 +1,130 @@
+import time
+
+import pytest
+
+import engine
+from calibration import Calibration
+from engine import ShootingEngine
+from turntable import SimulatedDriver
+
+
+@pytest.fixture
+def shooter(monkeypatch):
+    monkeypatch.setattr(engine, "ROT1DEG_CD", 0.05)
+    monkeypatch.setattr(engine, "COUNT_DOWN_TIME", 1)
+    driver = SimulatedDriver(absolute_moves=True, speed_control=True, speed=1000.0)
+    shooter = ShootingEngine(driver=driver)
+    shooter.waitingHandler_th.cancel()
+    shooter.connectState = "connected"
+    events = []
+    shooter.add_status_listener(lambda s, event: events.append((time.monotonic(), event)))
+    shooter.events = events
+    yield shooter
+    shooter.cancel_shooting()
+    shooter.cancel_threads()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def idle(shooter):
+    return shooter.camera_state == "idle" and not shooter.sessions
+
+
+def rotations(shooter):
+    return [c[1] for c in shooter.driver.commands if c[0] == "rotate"]
+
+
+def test_queue_runs_sessions_in_order(shooter):
+    shooter.enqueue_sessions([
+        {"mode": "fixed_angle", "num_of_photos": 2, "angle": 3, "countdown": False},
+        {"mode": "fixed_angle", "num_of_photos": 2, "angle": 5},
+    ])
+    assert shooter.queued_sessions() == 1
+    wait_for(lambda: idle(shooter))
+    assert shooter.completed_sessions == 2
+    assert rotations(shooter) == [3, 3, 5, 5]
+
+
+def test_invalid_job_queues_nothing(shooter):
+    with pytest.raises(ValueError):
+        shooter.enqueue_sessions([{"num_of_photos": 2}, {"angle": "x"}])
+    assert shooter.queued_sessions() == 0
+    assert shooter.camera_state == "idle"
+
+
+def test_pause_parks_the_next_step(shooter):
+    shooter.enqueue_session({"mode": "fixed_angle", "num_of_photos": 3, "angle": 2,
+                             "countdown": False})
+    wait_for(lambda: shooter.photo_index >= 1)
+    shooter.pause()
+    assert shooter.get_status() == "paused"
+    commands = len(shooter.driver.commands)
+    time.sleep(0.3)
+    assert len(shooter.driver.commands) == commands
+    shooter.resume()
+    wait_for(lambda: idle(shooter))
+    assert shooter.photo_index == 3
+    assert rotations(shooter) == [2, 2, 2]
+
+
+def test_session_waits_for_the_phone(shooter):
+    shooter.connectState = "waiting"
+    shooter.enqueue_session({"mode": "fixed_angle", "num_of_photos": 1, "angle": 2,
+                             "countdown": False})
+    time.sleep(0.2)
+    assert shooter.get_status() == "paused"
+    assert shooter.driver.commands == []
+    shooter.connectState = "connected"
+    shooter.resume()
+    wait_for(lambda: idle(shooter))
+    assert rotations(shooter) == [2]
+
+
+def test_countdown_hides_the_spin_up(shooter):
+    shooter.driver.spin_up_time = 0.4
+    started = []
+    start_continuous = shooter.driver.start_continuous
+
+    def start(speed=None):
+        started.append(time.monotonic())
+        start_continuous(speed)
+    shooter.driver.start_continuous = start
+    begin = time.monotonic()
+    shooter.enqueue_session({"mode": "fixed_time_interval", "num_of_photos": 1,
+                             "time_interval": 2.0, "angle": 4})
+    wait_for(lambda: idle(shooter))
+    shot = next(t for t, event in shooter.events if event == "shot")
+    # the first shot lands when the countdown ends, the table was started
+    # spin_up_time before
+    assert shot - begin == pytest.approx(1.0, abs=0.1)
+    assert shot - started[0] == pytest.approx(0.4, abs=0.1)
+    assert shooter.driver.commands[0] == ("start", 2.0)
+
+
+def test_hurry_skips_the_rest_of_the_wait(shooter, monkeypatch):
+    monkeypatch.setattr(engine, "ROT1DEG_CD", 5.0)
+    shooter.add_local_trigger()
+    begin = time.monotonic()
+    shooter.enqueue_session({"mode": "fixed_angle", "num_of_photos": 2, "angle": 1,
+                             "countdown": False})
+    for photo in (1, 2):
+        wait_for(lambda: shooter.photo_index == photo and shooter.waiting_ack)
+        shooter.set_should_take_photo("false")
+    wait_for(lambda: idle(shooter))
+    assert time.monotonic() - begin < 1.0
+    assert rotations(shooter) == [1, 1]
+
+
+def test_angle_step_sets_the_spin_speed(shooter):
+    shooter.calibration = Calibration(0.0, 4.0, 0.0, 0.0)
+    shooter.set_mode("fixed_time_interval")
+    shooter.set_angle_step(10)
+    assert shooter.time_interval == 2.5
+    assert shooter.continuous_speed() == 4.0
+    shooter.set_angle(5)
+    assert shooter.continuous_speed() == 2.0
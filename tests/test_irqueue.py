@@ -0,0 +1,65 @@
+import threading
+import time
+
+from irqueue import IrQueue
+
+# long enough to queue up everything while the first send waits it out
+GAP = 200000
+
+
+class Sender(object):
+    def __init__(self):
+        self.sent = []
+        self.first = threading.Event()
+
+    def send_once(self, key, count=1):
+        self.sent.append((key, count))
+        self.first.set()
+
+
+def wait_sent(sender, n, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while len(sender.sent) < n and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return sender.sent
+
+
+def test_stop_first_and_coalescing():
+    sender = Sender()
+    queue = IrQueue(sender, GAP, ["KEY_1", "KEY_RESTART", "KEY_STOP"])
+    queue.send("KEY_1")
+    assert sender.first.wait(1.0)
+    queue.send("KEY_1")
+    queue.send("KEY_RESTART")
+    queue.send("KEY_1", 2)
+    queue.send("KEY_STOP")
+    sent = wait_sent(sender, 4)
+    queue.close()
+    assert sent == [("KEY_1", 1), ("KEY_STOP", 1), ("KEY_1", 3), ("KEY_RESTART", 1)]
+    stats = queue.stats()
+    assert stats["coalesced"] == 2
+    assert stats["frames"] == 6
+
+
+def test_gap():
+    sender = Sender()
+    queue = IrQueue(sender, GAP, ["KEY_RESTART"])
+    times = []
+    sender.send_once = lambda key, count=1: times.append(time.monotonic())
+    queue.send("KEY_RESTART")
+    queue.send("KEY_RESTART")
+    deadline = time.monotonic() + 2.0
+    while len(times) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    queue.close()
+    assert len(times) == 2
+    assert times[1] - times[0] >= GAP / 1e6
+
+
+def test_rejects_unknown_keys():
+    sender = Sender()
+    queue = IrQueue(sender, GAP, ["KEY_1"])
+    assert not queue.send("KEY_9")
+    queue.close()
+    assert queue.stats()["rejected"] == 1
+    assert sender.sent == []
@@ -0,0 +1,100 @@
+import os
+from array import array
+
+import pytest
+
+import lircd
+
+CONF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pisel.lircd.conf")
+
+
+def remote():
+    return lircd.parse(CONF)["pisel"]
+
+
+def test_parse():
+    r = remote()
+    assert r.keys() == ["KEY_1", "KEY_RESTART", "KEY_STOP"]
+    assert r.codes["KEY_1"] == 0xFF629D
+    assert r.header == (9069, 4442)
+    assert r.repeat == (9065, 2189)
+    assert r.flags == ["SPACE_ENC", "CONST_LENGTH"]
+    assert r.gap == 107935
+    assert r.frequency == 38000
+
+
+def test_nec_frame():
+    r = remote()
+    frame = r.frame("KEY_1")
+    # header, 8 pre data bits and 24 code bits as pulse/space pairs, trail
+    assert len(frame) == 2 + 2 * 32 + 1
+    assert tuple(frame[:2]) == (9069, 4442)
+    assert frame[-1] == 666
+    bits = ""
+    for i in range(2, 2 + 2 * 32, 2):
+        assert frame[i] == 660
+        bits += "1" if frame[i + 1] == 1574 else "0"
+        assert frame[i + 1] in (1574, 467)
+    assert int(bits, 2) == 0x00FF629D
+
+
+def test_repeat_frame():
+    assert tuple(remote().repeat_frame("KEY_1")) == (9065, 2189, 666)
+
+
+def test_const_length_gap():
+    r = remote()
+    frame = r.frame("KEY_1")
+    assert sum(frame) + r.space_after(frame) == 107935
+    repeat = r.repeat_frame("KEY_1")
+    assert sum(repeat) + r.space_after(repeat) == 107935
+
+
+def test_pulse_train_with_repeats():
+    r = remote()
+    frame = r.frame("KEY_1")
+    repeat = r.repeat_frame("KEY_1")
+    (values, space), = r.pulse_train("KEY_1", 3)
+    expected = array("I", frame)
+    expected.append(r.space_after(frame))
+    expected.extend(repeat)
+    expected.append(r.space_after(repeat))
+    expected.extend(repeat)
+    assert values == expected
+    assert space == r.space_after(repeat)
+    assert r.pulse_train("KEY_1", 3) is r.pulse_train("KEY_1", 3)
+
+
+def test_pulse_train_chunks():
+    r = remote()
+    chunks = r.pulse_train("KEY_1", 200)
+    assert len(chunks) > 1
+    assert all(len(values) <= lircd.LIRC_MAX_VALUES for values, space in chunks)
+    # every chunk ends on a pulse, odd length
+    assert all(len(values) % 2 == 1 for values, space in chunks)
+
+
+def test_device_file(tmp_path):
+    r = remote()
+    path = str(tmp_path / "lirc")
+    open(path, "wb").close()
+    device = lircd.LircDevice(r, path, allow_file=True)
+    assert device.send_once("KEY_STOP")
+    assert not device.send_once("KEY_9")
+    device.close()
+    with open(path, "rb") as f:
+        assert array("I", f.read()) == r.frame("KEY_STOP")
+
+
+def test_device_must_exist(tmp_path):
+    path = str(tmp_path / "lirc")
+    with pytest.raises(FileNotFoundError):
+        lircd.LircDevice(remote(), path)
+    assert not os.path.exists(path)
+
+
+def test_plain_file_is_refused(tmp_path):
+    path = str(tmp_path / "lirc")
+    open(path, "wb").close()
+    with pytest.raises(ValueError):
+        lircd.LircDevice(remote(), path)
@@ -0,0 +1,35 @@
+import os
+import select
+
+import pytest
+
+dbus = pytest.importorskip("dbus")
+GLib = pytest.importorskip("gi.repository.GLib")
+
+from service import Characteristic
+
+
+def characteristic():
+    # the socket handling needs no bus
+    chrc = Characteristic.__new__(Characteristic)
+    chrc.acquire_notify = True
+    chrc.notify_sock = None
+    chrc.notify_watch = None
+    return chrc
+
+
+def test_notify_socket_released_when_peer_closes():
+    chrc = characteristic()
+    unix_fd, mtu = chrc.AcquireNotify({"mtu": dbus.UInt16(100)})
+    assert mtu == 100
+    local = chrc.notify_sock
+    # bluetoothd holds the only other copy of the peer end
+    os.close(unix_fd.take())
+    poll = select.poll()
+    poll.register(local.fileno(), select.POLLHUP)
+    assert poll.poll(1000)
+    context = GLib.MainContext.default()
+    while context.iteration(False):
+        pass
+    assert chrc.notify_sock is None
+    assert chrc.notify_watch is None
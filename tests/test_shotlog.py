@@ -0,0 +1,35 @@
+from shotlog import PAGE_HEADER, RECORD, ShotLog
+
+
+def records(page):
+    count, start, first = PAGE_HEADER.unpack_from(page)
+    body = page[PAGE_HEADER.size:]
+    return first, [RECORD.unpack_from(body, i) for i in range(0, len(body), RECORD.size)]
+
+
+def test_pages_cover_the_log():
+    log = ShotLog()
+    for i in range(50):
+        log.add_shot(i, float(i), log.start_time + i)
+    size = PAGE_HEADER.size + 4 * RECORD.size
+    shots = []
+    position = 0
+    while True:
+        page = log.read_page(position, size)
+        assert len(page) <= size
+        first, page_records = records(page)
+        assert first == position
+        if not page_records:
+            break
+        shots += [r[0] for r in page_records]
+        position += len(page_records)
+    assert shots == list(range(50))
+
+
+def test_page_holds_at_least_one_record():
+    log = ShotLog()
+    log.add_shot(0, 0.0, log.start_time)
+    log.add_shot(1, 1.0, log.start_time)
+    first, page_records = records(log.read_page(1, 22))
+    assert first == 1
+    assert [r[0] for r in page_records] == [1]
@@ -0,0 +1,30 @@
+from turntable import SimulatedDriver
+
+
+def test_pulse_moves():
+    driver = SimulatedDriver(degree_time=1.0)
+    driver.zero()
+    driver.rotate(1)
+    driver.rotate(2)
+    assert driver.read() == 3
+    assert driver.move_time(2) == 2.0
+    assert driver.commands == [("rotate", 1), ("rotate", 2)]
+
+
+def test_absolute_moves():
+    driver = SimulatedDriver(absolute_moves=True, speed=30.0)
+    assert driver.move_time(15) == 0.5
+    assert driver.wait_idle() == 0.0
+
+
+def test_continuous(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("turntable.time.monotonic", lambda: now[0])
+    driver = SimulatedDriver(speed_control=True)
+    driver.start_continuous(10.0)
+    now[0] += 2.0
+    assert driver.read() == 20.0
+    driver.stop()
+    now[0] += 5.0
+    assert driver.read() == 20.0
+    assert [c[0] for c in driver.commands] == ["start", "stop"]
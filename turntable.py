@@ -0,0 +1,241 @@
+import threading
+import time
+
+from angle import PositionReader
+
+# the IR turntable turns 1 degree per KEY_1 and needs this long per pulse
+IR_DEGREE_TIME = 1.0
+IR_SPIN_UP_TIME = 2.0
+IR_SPIN_DOWN_TIME = 2.0
+
+
+class TurntableDriver(object):
+    """
+    What the shooting engine needs from a turntable. absolute_moves means
+    rotate() turns an exact angle in one command, speed_control means
+    start_continuous() honours its speed (degrees per second).
+    """
+    absolute_moves = False
+    speed_control = False
+    spin_up_time = 0.0
+    spin_down_time = 0.0
+
+    def rotate(self, degrees):
+        raise NotImplementedError()
+
+    def start_continuous(self, speed=None):
+        raise NotImplementedError()
+
+    def stop(self):
+        raise NotImplementedError()
+
+    def move_time(self, degrees):
+        """Seconds rotate(degrees) takes."""
+        raise NotImplementedError()
+
+    def wait_idle(self):
+        """Block until the last rotate() has finished, returns the seconds waited."""
+        return 0.0
+
+    def close(self):
+        pass
+
+
+class IrTurntableDriver(TurntableDriver):
+    """
+    The IR controlled turntable: KEY_1 turns it by 1 degree, KEY_RESTART and
+    KEY_STOP start and stop free spinning at its own speed.
+    """
+    spin_up_time = IR_SPIN_UP_TIME
+    spin_down_time = IR_SPIN_DOWN_TIME
+
+    def __init__(self, get_ir):
+        # get_ir returns the IR queue, which is only built on first use
+        self.get_ir = get_ir
+
+    def rotate(self, degrees):
+        self.get_ir().send("KEY_1", degrees)
+
+    def start_continuous(self, speed=None):
+        self.get_ir().send("KEY_RESTART")
+
+    def stop(self):
+        self.get_ir().send("KEY_STOP")
+
+    def move_time(self, degrees):
+        return degrees * IR_DEGREE_TIME
+
+
+class SerialTurntableDriver(TurntableDriver):
+    """
+    Turntable controller on a serial line speaking a line based protocol:
+    "ROT <degrees>", "RUN <degrees per second>" and "STOP", each answered
+    with a line.
+    """
+    absolute_moves = True
+    speed_control = True
+
+    def __init__(self, port, baudrate=115200, speed=30.0, timeout=1.0):
+        import serial
+        self.serial = serial.Serial(port, baudrate, timeout=timeout)
+        self.speed = speed
+        self.lock = threading.Lock()
+
+    def command(self, line):
+        with self.lock:
+            self.serial.write((line + "\n").encode())
+            reply = self.serial.readline().decode(errors="replace").strip()
+        if reply != "OK":
+            print(f"turntable replied '{reply}' to '{line}'")
+        return reply
+
+    def rotate(self, degrees):
+        self.command(f"ROT {degrees}")
+
+    def start_continuous(self, speed=None):
+        self.command(f"RUN {speed if speed is not None else self.speed}")
+
+    def stop(self):
+        self.command("STOP")
+
+    def move_time(self, degrees):
+        return abs(degrees) / self.speed
+
+    def close(self):
+        self.serial.close()
+
+
+class GpioStepperDriver(TurntableDriver):
+    """
+    Stepper motor on a step/dir driver board wired to GPIO pins (BCM).
+    Moves run on a thread so the caller is never blocked; a rotate() while
+    the previous one is still running waits for it instead of cutting it.
+    """
+    absolute_moves = True
+    speed_control = True
+
+    def __init__(self, step_pin, dir_pin, steps_per_degree, speed=30.0):
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+        self.step_pin = step_pin
+        self.dir_pin = dir_pin
+        self.steps_per_degree = steps_per_degree
+        self.speed = speed
+        self.stopping = threading.Event()
+        self.mover = None
+        self.continuous = False
+
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup([step_pin, dir_pin], GPIO.OUT, initial=GPIO.LOW)
+
+    def run_steps(self, steps, speed):
+        # pulses are timed against the start so sleep and GPIO overhead do
+        # not add up over a move
+        period = 1.0 / (speed * self.steps_per_degree)
+        start = time.monotonic()
+        n = 0
+        while (steps is None or n < steps) and not self.stopping.is_set():
+            self.GPIO.output(self.step_pin, self.GPIO.HIGH)
+            self.sleep_until(start + (n + 0.5) * period)
+            self.GPIO.output(self.step_pin, self.GPIO.LOW)
+            n += 1
+            self.sleep_until(start + n * period)
+
+    def sleep_until(self, t):
+        delay = t - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def start_mover(self, steps, speed):
+        self.stop()
+        self.stopping.clear()
+        self.continuous = steps is None
+        self.mover = threading.Thread(target=self.run_steps, args=(steps, speed), daemon=True)
+        self.mover.start()
+
+    def wait_idle(self):
+        mover = self.mover
+        if mover is None or self.continuous:
+            return 0.0
+        start = time.monotonic()
+        mover.join()
+        return time.monotonic() - start
+
+    def rotate(self, degrees):
+        waited = self.wait_idle()
+        if waited > 0.001:
+            print(f"stepper: waited {waited:.3f}s for the previous move to finish")
+        self.GPIO.output(self.dir_pin, self.GPIO.HIGH if degrees >= 0 else self.GPIO.LOW)
+        self.start_mover(int(round(abs(degrees) * self.steps_per_degree)), self.speed)
+
+    def start_continuous(self, speed=None):
+        self.GPIO.output(self.dir_pin, self.GPIO.HIGH)
+        self.start_mover(None, speed if speed is not None else self.speed)
+
+    def stop(self):
+        self.stopping.set()
+        if self.mover is not None:
+            self.mover.join()
+            self.mover = None
+
+    def move_time(self, degrees):
+        return abs(degrees) / self.speed
+
+    def close(self):
+        self.stop()
+        self.GPIO.cleanup([self.step_pin, self.dir_pin])
+
+
+class SimulatedDriver(TurntableDriver, PositionReader):
+    """
+    Turntable that only exists in memory, for tests. It records the
+    commands it gets and, as a PositionReader, reports where it would be.
+    """
+    def __init__(self, absolute_moves=False, speed_control=False,
+                 speed=30.0, degree_time=IR_DEGREE_TIME):
+        self.absolute_moves = absolute_moves
+        self.speed_control = speed_control
+        self.speed = speed
+        self.degree_time = degree_time
+        self.commands = []
+        self.angle = 0.0
+        self.spinning_since = None
+        self.spin_speed = 0.0
+        self.lock = threading.Lock()
+
+    def current(self):
+        angle = self.angle
+        if self.spinning_since is not None:
+            angle += (time.monotonic() - self.spinning_since) * self.spin_speed
+        return angle
+
+    def rotate(self, degrees):
+        with self.lock:
+            self.commands.append(("rotate", degrees))
+            self.angle += degrees
+
+    def start_continuous(self, speed=None):
+        with self.lock:
+            self.commands.append(("start", speed))
+            self.angle = self.current()
+            self.spinning_since = time.monotonic()
+            self.spin_speed = speed if speed is not None else self.speed
+
+    def stop(self):
+        with self.lock:
+            self.commands.append(("stop", None))
+            self.angle = self.current()
+            self.spinning_since = None
+
+    def move_time(self, degrees):
+        if self.absolute_moves:
+            return abs(degrees) / self.speed
+        return abs(degrees) * self.degree_time
+
+    def read(self):
+        with self.lock:
+            return self.current()
+
+    def zero(self):
+        with self.lock:
+            self.angle = self.angle - self.current()